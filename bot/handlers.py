@@ -1,17 +1,26 @@
 """
 Telegram bot command handlers
 """
+import asyncio
+import functools
 import logging
+import re
+import shlex
+from operator import attrgetter
+from typing import Optional, Union
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command, CommandStart
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from config import settings
+from config import get_settings
 from database.db import db, Server
-from core.ssh_manager import SSHManager, LocalSSHManager
-from core.health_checker import HealthChecker, check_local_server, check_remote_server
+from core import background, ssh_pool
+from core.flags import COUNTRY_FLAGS
+from core.optimize import MAX_OUTPUT_BYTES, OPTIMIZE_COMMANDS, run_all_optimizations
+from core.ssh_manager import SSHManager, LocalSSHManager, SSHResult
+from core.health_checker import HealthChecker, HealthReport
 from core.report_formatter import (
     format_full_report,
     format_short_report,
@@ -29,29 +38,52 @@ from bot.keyboards import (
     settings_keyboard,
     schedule_keyboard
 )
+from bot.report_cache import get_report, invalidate
+from bot.throttle import ThrottledEditor, safe_edit
 
 logger = logging.getLogger(__name__)
 router = Router()
 
 
-# Country flags mapping
-COUNTRY_FLAGS = {
-    "USA": "🇺🇸",
-    "Finland": "🇫🇮",
-    "Germany": "🇩🇪",
-    "Netherlands": "🇳🇱",
-    "Russia": "🇷🇺",
-    "UK": "🇬🇧",
-    "France": "🇫🇷",
-    "Canada": "🇨🇦",
-    "Japan": "🇯🇵",
-    "Singapore": "🇸🇬",
+@functools.lru_cache(maxsize=1)
+def _check_semaphore() -> asyncio.Semaphore:
+    """Limit of servers checked at the same time (MAX_PARALLEL_CHECKS, read on first use)"""
+    return asyncio.Semaphore(get_settings().max_parallel_checks)
+
+
+# Freed space reported by journalctl --vacuum-size
+_FREED_RE = re.compile(r'freed ([\d.]+[KMGT]?B?)')
+
+# Progress bar pieces, sliced instead of rebuilt on every update
+_BAR_WIDTH = 64
+_BAR_FULL = "▓" * _BAR_WIDTH
+_BAR_EMPTY = "░" * _BAR_WIDTH
+_PROGRESS_TITLE = "🔄 <b>Проверка серверов</b>"
+
+# Fields shown per server in the servers list
+_server_fields = attrgetter("name", "host", "last_status", "flag")
+
+# Server status emoji (None = never checked)
+_STATUS_EMOJI = {"ok": "🟢", "warning": "🟡", "critical": "🔴", None: "⚪"}
+
+# Progress texts for single-server cleanups: kind -> (callback ack, message text)
+_OPT_PROGRESS = {
+    "journal": ("🔄 Очищаю журналы...", "🔄 Очищаю журналы на {name}..."),
+    "cache": ("🔄 Очищаю кэш...", "🔄 Очищаю кэш на {name}..."),
+    "logs": ("🔄 Очищаю логи...", "🔄 Очищаю старые логи на {name}..."),
+    "packages": ("🔄 Удаляю старые пакеты...", "🔄 Удаляю старые пакеты на {name}..."),
+    "all": ("🔄 Оптимизирую...", "🔄 Выполняю полную оптимизацию {name}..."),
 }
 
+_OPT_LABELS = {
+    "journal": "Журналы",
+    "cache": "Кэш",
+    "logs": "Логи",
+    "packages": "Старые пакеты",
+}
 
-def get_server_flag(server_name: str) -> str:
-    """Get country flag for server"""
-    return COUNTRY_FLAGS.get(server_name, "🌐")
+# Running cleanups by (chat_id, server name, kind); also keeps the tasks referenced
+_OPT_RUNNING: dict[tuple[int, str, str], asyncio.Task] = {}
 
 
 # FSM States for adding server
@@ -60,6 +92,7 @@ class AddServerStates(StatesGroup):
     host = State()
     port = State()
     username = State()
+    country = State()
     key_path = State()
 
 
@@ -91,6 +124,7 @@ async def cmd_help(message: Message):
 
 <b>Управление:</b>
 /add — Добавить сервер
+/add имя хост [порт] [пользователь] [страна] — Добавить одной командой
 /remove — Удалить сервер
 
 <b>Настройки:</b>
@@ -107,7 +141,7 @@ async def cmd_help(message: Message):
 @router.message(Command("status"))
 async def cmd_status(message: Message):
     """Quick status of all servers"""
-    if message.from_user.id != settings.admin_id:
+    if message.from_user.id != get_settings().admin_id:
         return
     
     await message.answer("🔄 Проверяю серверы...")
@@ -121,23 +155,15 @@ async def cmd_status(message: Message):
         )
         return
     
-    reports = []
-    for server in servers:
-        try:
-            if server.host == "localhost":
-                report = await check_local_server(server.name)
-            else:
-                report = await check_remote_server(
-                    host=server.host,
-                    name=server.name,
-                    port=server.port,
-                    username=server.username,
-                    key_path=server.key_path
-                )
-            reports.append(report)
-            await db.update_last_check(server.name, report.overall_status)
-        except Exception as e:
-            logger.error(f"Error checking {server.name}: {e}")
+    results = await asyncio.gather(
+        *(_check_one(server) for server in servers),
+        return_exceptions=True
+    )
+    checked = [r for r in results if isinstance(r, tuple) and r[1] is not None]
+    reports = [report for _, report in checked]
+    await db.update_last_check_bulk(
+        [(server.name, report.overall_status) for server, report in checked]
+    )
     
     if reports:
         text = format_all_servers_summary(reports, servers)
@@ -149,13 +175,13 @@ async def cmd_status(message: Message):
 @router.message(Command("check"))
 async def cmd_check(message: Message):
     """Check specific server or show menu"""
-    if message.from_user.id != settings.admin_id:
+    if message.from_user.id != get_settings().admin_id:
         return
     
-    args = message.text.split(maxsplit=1)
+    _, _, server_name = message.text.partition(" ")
+    server_name = server_name.strip()
     
-    if len(args) > 1:
-        server_name = args[1]
+    if server_name:
         await check_server_by_name(message, server_name)
     else:
         servers = await db.get_all_servers()
@@ -168,31 +194,47 @@ async def cmd_check(message: Message):
 @router.message(Command("servers"))
 async def cmd_servers(message: Message):
     """List all servers"""
-    if message.from_user.id != settings.admin_id:
+    if message.from_user.id != get_settings().admin_id:
         return
 
     servers = await db.get_all_servers()
 
-    # Build text with server info: status, flag, IP, name
-    lines = ["🖥 <b>Серверы:</b>", ""]
-    for server in servers:
-        status_emoji = {
-            "ok": "🟢", "warning": "🟡", "critical": "🔴", None: "⚪"
-        }.get(server.last_status, "⚪")
-        flag = get_server_flag(server.name)
-        lines.append(f"{status_emoji} {flag} <code>{server.host}</code> — {server.name}")
-
     await message.answer(
-        "\n".join(lines),
+        _render_server_list(servers),
         reply_markup=servers_list_keyboard(servers, "server"),
         parse_mode="HTML"
     )
 
 
 @router.message(Command("add"))
-async def cmd_add(message: Message, state: FSMContext):
-    """Start adding a server"""
-    if message.from_user.id != settings.admin_id:
+async def cmd_add(message: Message, state: FSMContext, command: CommandObject):
+    """Start adding a server, or add it right away from command arguments"""
+    if message.from_user.id != get_settings().admin_id:
+        return
+    
+    if command.args:
+        # /add <name> <host> [port] [username] [country]
+        try:
+            fields = shlex.split(command.args)
+        except ValueError:
+            fields = []
+        if not 2 <= len(fields) <= 5:
+            await message.answer(
+                "❌ Формат: <code>/add имя хост [порт] [пользователь] [страна]</code>",
+                parse_mode="HTML"
+            )
+            return
+        
+        server = _validate_server_fields(*fields)
+        if isinstance(server, str):
+            await message.answer(server)
+            return
+        if await db.get_server(server.name):
+            await message.answer("❌ Сервер с таким именем уже существует")
+            return
+        
+        await state.clear()
+        await _save_new_server(message, server)
         return
     
     await state.set_state(AddServerStates.name)
@@ -208,7 +250,8 @@ async def cmd_add(message: Message, state: FSMContext):
 @router.callback_query(F.data == "main_menu")
 async def cb_main_menu(callback: CallbackQuery):
     """Return to main menu"""
-    await callback.message.edit_text(
+    await safe_edit(
+        callback.message,
         "🖥 <b>Server Health Bot</b>\n\nВыберите действие:",
         reply_markup=main_menu_keyboard(),
         parse_mode="HTML"
@@ -224,7 +267,8 @@ async def cb_status_all(callback: CallbackQuery):
     servers = await db.get_all_servers()
 
     if not servers:
-        await callback.message.edit_text(
+        await safe_edit(
+            callback.message,
             "📭 Нет серверов",
             reply_markup=servers_list_keyboard([])
         )
@@ -232,41 +276,35 @@ async def cb_status_all(callback: CallbackQuery):
 
     total = len(servers)
     reports = []
+    statuses = []
+
+    # Check servers concurrently, updating progress as each one finishes
+    editor = ThrottledEditor(callback.message)
+    tasks = [_check_one(server) for server in servers]
+    for i, task in enumerate(asyncio.as_completed(tasks), 1):
+        server, report = await task
+        if report is not None:
+            reports.append(report)
+            statuses.append((server.name, report.overall_status))
 
-    for i, server in enumerate(servers, 1):
-        # Update progress message
-        flag = get_server_flag(server.name)
-        progress_bar = "▓" * i + "░" * (total - i)
-        await callback.message.edit_text(
-            f"🔄 <b>Проверка серверов</b> [{i}/{total}]\n\n"
-            f"{progress_bar}\n\n"
-            f"➡️ {flag} {server.name} (<code>{server.host}</code>)...",
+        await editor.update(
+            f"{_PROGRESS_TITLE} [{i}/{total}]\n\n"
+            f"{_progress_bar(i, total)}\n\n"
+            f"{'✅' if report else '❌'} {server.flag} {server.name} (<code>{server.host}</code>)",
             parse_mode="HTML"
         )
-
-        try:
-            if server.host == "localhost":
-                report = await check_local_server(server.name)
-            else:
-                report = await check_remote_server(
-                    host=server.host,
-                    name=server.name,
-                    port=server.port,
-                    username=server.username,
-                    key_path=server.key_path
-                )
-            reports.append(report)
-            await db.update_last_check(server.name, report.overall_status)
-        except Exception as e:
-            logger.error(f"Error checking {server.name}: {e}")
+    
+    await db.update_last_check_bulk(statuses)
     
     if reports:
         text = format_all_servers_summary(reports, servers)
-        await callback.message.edit_text(
+        await editor.flush(
             text,
             parse_mode="HTML",
             reply_markup=main_menu_keyboard()
         )
+    else:
+        await editor.flush()
 
 
 @router.callback_query(F.data == "servers_list")
@@ -274,17 +312,9 @@ async def cb_servers_list(callback: CallbackQuery):
     """Show servers list"""
     servers = await db.get_all_servers()
 
-    # Build text with server info: status, flag, IP, name
-    lines = ["🖥 <b>Серверы:</b>", ""]
-    for server in servers:
-        status_emoji = {
-            "ok": "🟢", "warning": "🟡", "critical": "🔴", None: "⚪"
-        }.get(server.last_status, "⚪")
-        flag = get_server_flag(server.name)
-        lines.append(f"{status_emoji} {flag} <code>{server.host}</code> — {server.name}")
-
-    await callback.message.edit_text(
-        "\n".join(lines),
+    await safe_edit(
+        callback.message,
+        _render_server_list(servers),
         reply_markup=servers_list_keyboard(servers, "server"),
         parse_mode="HTML"
     )
@@ -301,12 +331,7 @@ async def cb_server_detail(callback: CallbackQuery):
         await callback.answer("Сервер не найден", show_alert=True)
         return
     
-    status_emoji = {
-        "ok": "🟢",
-        "warning": "🟡",
-        "critical": "🔴",
-        None: "⚪"
-    }.get(server.last_status, "⚪")
+    status_emoji = _STATUS_EMOJI.get(server.last_status, "⚪")
     
     text = (
         f"🖥 <b>{server.name}</b>\n\n"
@@ -316,7 +341,8 @@ async def cb_server_detail(callback: CallbackQuery):
         f"🕐 Последняя проверка: {server.last_check or 'никогда'}"
     )
     
-    await callback.message.edit_text(
+    await safe_edit(
+        callback.message,
         text,
         reply_markup=server_actions_keyboard(server_name),
         parse_mode="HTML"
@@ -324,42 +350,36 @@ async def cb_server_detail(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("check:"))
+@router.callback_query(F.data.startswith("check:") | F.data.startswith("refresh:"))
 async def cb_check_server(callback: CallbackQuery):
-    """Check specific server"""
+    """Check specific server ("refresh:" bypasses the report cache)"""
     server_name = callback.data.split(":")[1]
+    force = callback.data.startswith("refresh:")
     await callback.answer("🔄 Проверяю...")
-    await callback.message.edit_text(f"🔄 Проверяю {server_name}...")
+    await safe_edit(callback.message, f"🔄 Проверяю {server_name}...")
     
     server = await db.get_server(server_name)
     
     if not server:
-        await callback.message.edit_text("❌ Сервер не найден")
+        await safe_edit(callback.message, "❌ Сервер не найден")
         return
     
     try:
-        if server.host == "localhost":
-            report = await check_local_server(server.name)
-        else:
-            report = await check_remote_server(
-                host=server.host,
-                name=server.name,
-                port=server.port,
-                username=server.username,
-                key_path=server.key_path
-            )
+        report = await get_report(server, force=force)
         
         await db.update_last_check(server_name, report.overall_status)
 
         text = format_full_report(report, server)
-        await callback.message.edit_text(
+        await safe_edit(
+            callback.message,
             text,
             reply_markup=report_actions_keyboard(server_name),
             parse_mode="HTML"
         )
     except Exception as e:
         logger.error(f"Error checking {server_name}: {e}")
-        await callback.message.edit_text(
+        await safe_edit(
+            callback.message,
             f"❌ Ошибка проверки: {str(e)}",
             reply_markup=server_actions_keyboard(server_name)
         )
@@ -378,32 +398,25 @@ async def cb_processes(callback: CallbackQuery):
         return
     
     try:
-        if server.host == "localhost":
-            report = await check_local_server(server.name)
-        else:
-            report = await check_remote_server(
-                host=server.host,
-                name=server.name,
-                port=server.port,
-                username=server.username,
-                key_path=server.key_path
-            )
+        report = await get_report(server)
         
         text = format_processes_report(report)
-        await callback.message.edit_text(
+        await safe_edit(
+            callback.message,
             text,
             reply_markup=report_actions_keyboard(server_name),
             parse_mode="HTML"
         )
     except Exception as e:
-        await callback.message.edit_text(f"❌ Ошибка: {str(e)}")
+        await safe_edit(callback.message, f"❌ Ошибка: {str(e)}")
 
 
 @router.callback_query(F.data.startswith("optimize:"))
 async def cb_optimize_menu(callback: CallbackQuery):
     """Show optimization options"""
     server_name = callback.data.split(":")[1]
-    await callback.message.edit_text(
+    await safe_edit(
+        callback.message,
         f"🛠 <b>Оптимизация {server_name}</b>\n\n"
         "Выберите действие:",
         reply_markup=optimize_keyboard(server_name),
@@ -412,181 +425,36 @@ async def cb_optimize_menu(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("opt_journal:"))
-async def cb_opt_journal(callback: CallbackQuery):
-    """Clean systemd journal logs"""
-    server_name = callback.data.split(":")[1]
-    server = await db.get_server(server_name)
-
-    if not server:
-        await callback.answer("Сервер не найден", show_alert=True)
-        return
-
-    await callback.answer("🔄 Очищаю журналы...")
-    await callback.message.edit_text(f"🔄 Очищаю журналы на {server_name}...")
-
-    try:
-        ssh = SSHManager(
-            host=server.host,
-            port=server.port,
-            username=server.username,
-            key_path=server.key_path
-        )
-        result = await ssh.execute("journalctl --vacuum-size=200M 2>&1")
-
-        if result.success:
-            # Parse freed space from output
-            import re
-            match = re.search(r'freed ([\d.]+[KMGT]?B?)', result.stdout)
-            freed = match.group(1) if match else "some space"
-            await callback.message.edit_text(
-                f"✅ <b>Журналы очищены на {server_name}</b>\n\n"
-                f"Освобождено: {freed}",
-                reply_markup=optimize_keyboard(server_name),
-                parse_mode="HTML"
-            )
-        else:
-            await callback.message.edit_text(
-                f"❌ Ошибка: {result.stderr}",
-                reply_markup=optimize_keyboard(server_name),
-                parse_mode="HTML"
-            )
-    except Exception as e:
-        logger.error(f"Error cleaning journal on {server_name}: {e}")
-        await callback.message.edit_text(
-            f"❌ Ошибка: {str(e)}",
-            reply_markup=optimize_keyboard(server_name),
-            parse_mode="HTML"
-        )
-
-
-@router.callback_query(F.data.startswith("opt_cache:"))
-async def cb_opt_cache(callback: CallbackQuery):
-    """Clean system cache"""
-    server_name = callback.data.split(":")[1]
-    server = await db.get_server(server_name)
-
-    if not server:
-        await callback.answer("Сервер не найден", show_alert=True)
-        return
-
-    await callback.answer("🔄 Очищаю кэш...")
-    await callback.message.edit_text(f"🔄 Очищаю кэш на {server_name}...")
-
-    try:
-        ssh = SSHManager(
-            host=server.host,
-            port=server.port,
-            username=server.username,
-            key_path=server.key_path
-        )
-        # Clean apt cache and tmp files older than 7 days
-        result = await ssh.execute(
-            "apt-get clean 2>/dev/null; "
-            "rm -rf /tmp/* 2>/dev/null; "
-            "rm -rf /var/tmp/* 2>/dev/null; "
-            "echo 'OK'"
-        )
-
-        await callback.message.edit_text(
-            f"✅ <b>Кэш очищен на {server_name}</b>\n\n"
-            "Очищено:\n"
-            "• APT кэш\n"
-            "• /tmp\n"
-            "• /var/tmp",
-            reply_markup=optimize_keyboard(server_name),
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Error cleaning cache on {server_name}: {e}")
-        await callback.message.edit_text(
-            f"❌ Ошибка: {str(e)}",
-            reply_markup=optimize_keyboard(server_name),
-            parse_mode="HTML"
-        )
-
-
-@router.callback_query(F.data.startswith("opt_logs:"))
-async def cb_opt_logs(callback: CallbackQuery):
-    """Clean old log files"""
-    server_name = callback.data.split(":")[1]
+@router.callback_query(
+    F.data.startswith("opt_journal:")
+    | F.data.startswith("opt_cache:")
+    | F.data.startswith("opt_logs:")
+    | F.data.startswith("opt_packages:")
+    | F.data.startswith("opt_all:")
+)
+async def cb_opt_server(callback: CallbackQuery):
+    """Start a cleanup on a server in the background"""
+    action, _, server_name = callback.data.partition(":")
+    kind = action.removeprefix("opt_")
     server = await db.get_server(server_name)
 
     if not server:
         await callback.answer("Сервер не найден", show_alert=True)
         return
 
-    await callback.answer("🔄 Очищаю логи...")
-    await callback.message.edit_text(f"🔄 Очищаю старые логи на {server_name}...")
-
-    try:
-        ssh = SSHManager(
-            host=server.host,
-            port=server.port,
-            username=server.username,
-            key_path=server.key_path
-        )
-        # Truncate large log files and remove old rotated logs
-        result = await ssh.execute(
-            "find /var/log -name '*.gz' -delete 2>/dev/null; "
-            "find /var/log -name '*.1' -delete 2>/dev/null; "
-            "find /var/log -name '*.old' -delete 2>/dev/null; "
-            "truncate -s 0 /var/log/*.log 2>/dev/null; "
-            "echo 'OK'"
-        )
-
-        await callback.message.edit_text(
-            f"✅ <b>Логи очищены на {server_name}</b>\n\n"
-            "Очищено:\n"
-            "• Архивы логов (.gz, .1, .old)\n"
-            "• Текущие лог-файлы обрезаны",
-            reply_markup=optimize_keyboard(server_name),
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Error cleaning logs on {server_name}: {e}")
-        await callback.message.edit_text(
-            f"❌ Ошибка: {str(e)}",
-            reply_markup=optimize_keyboard(server_name),
-            parse_mode="HTML"
-        )
-
-
-@router.callback_query(F.data.startswith("opt_packages:"))
-async def cb_opt_packages(callback: CallbackQuery):
-    """Remove old packages"""
-    server_name = callback.data.split(":")[1]
-    server = await db.get_server(server_name)
-
-    if not server:
-        await callback.answer("Сервер не найден", show_alert=True)
+    key = (callback.message.chat.id, server_name, kind)
+    if key in _OPT_RUNNING:
+        await callback.answer("⏳ Уже выполняется")
         return
 
-    await callback.answer("🔄 Удаляю старые пакеты...")
-    await callback.message.edit_text(f"🔄 Удаляю старые пакеты на {server_name}...")
-
-    try:
-        ssh = SSHManager(
-            host=server.host,
-            port=server.port,
-            username=server.username,
-            key_path=server.key_path
-        )
-        result = await ssh.execute("apt-get autoremove -y 2>&1 | tail -5")
+    ack, progress = _OPT_PROGRESS[kind]
+    await callback.answer(ack)
+    await safe_edit(callback.message, progress.format(name=server_name))
 
-        await callback.message.edit_text(
-            f"✅ <b>Старые пакеты удалены на {server_name}</b>\n\n"
-            f"<code>{result.stdout[:500]}</code>",
-            reply_markup=optimize_keyboard(server_name),
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Error removing packages on {server_name}: {e}")
-        await callback.message.edit_text(
-            f"❌ Ошибка: {str(e)}",
-            reply_markup=optimize_keyboard(server_name),
-            parse_mode="HTML"
-        )
+    # Cleanups like apt-get autoremove can take a while, don't hold the handler
+    task = background.spawn(_run_opt(server, kind, callback.message), name=f"opt_{kind}:{server_name}")
+    _OPT_RUNNING[key] = task
+    task.add_done_callback(lambda _: _OPT_RUNNING.pop(key, None))
 
 
 @router.callback_query(F.data == "optimize_all")
@@ -597,7 +465,8 @@ async def cb_optimize_all(callback: CallbackQuery):
     servers = await db.get_all_servers()
 
     if not servers:
-        await callback.message.edit_text(
+        await safe_edit(
+            callback.message,
             "📭 Нет серверов для оптимизации",
             reply_markup=main_menu_keyboard()
         )
@@ -605,35 +474,26 @@ async def cb_optimize_all(callback: CallbackQuery):
 
     total = len(servers)
     results = []
+    editor = ThrottledEditor(callback.message)
 
     for i, server in enumerate(servers, 1):
-        flag = get_server_flag(server.name)
-        progress_bar = "▓" * i + "░" * (total - i)
+        flag = server.flag
 
-        await callback.message.edit_text(
+        await editor.update(
             f"🧹 <b>Оптимизация серверов</b> [{i}/{total}]\n\n"
-            f"{progress_bar}\n\n"
+            f"{_progress_bar(i, total)}\n\n"
             f"➡️ {flag} {server.name}...",
             parse_mode="HTML"
         )
 
         try:
-            ssh = SSHManager(
-                host=server.host,
-                port=server.port,
-                username=server.username,
-                key_path=server.key_path
-            )
+            ssh = await ssh_pool.acquire_server(server)
 
-            # Run optimization commands
-            journal_result = await ssh.execute("journalctl --vacuum-size=200M 2>&1")
-            cache_result = await ssh.execute(
-                "apt-get clean 2>/dev/null; "
-                "rm -rf /tmp/* /var/tmp/* 2>/dev/null; "
-                "echo OK"
-            )
+            # Clean journal and cache in one round trip
+            sections = await run_all_optimizations(ssh, ("journal", "cache"))
+            invalidate(server.name)
 
-            status = "✅" if journal_result.success else "⚠️"
+            status = "✅" if all(r.success for r in sections.values()) else "⚠️"
             results.append(f"{status} {flag} {server.name}")
 
         except Exception as e:
@@ -641,7 +501,7 @@ async def cb_optimize_all(callback: CallbackQuery):
             results.append(f"❌ {flag} {server.name}: {str(e)[:30]}")
 
     # Show results
-    await callback.message.edit_text(
+    await editor.flush(
         "🧹 <b>Оптимизация завершена</b>\n\n" +
         "\n".join(results) +
         "\n\n<i>Очищены журналы и кэш на всех серверах</i>",
@@ -663,7 +523,8 @@ async def cb_server_map(callback: CallbackQuery):
     services = await db.get_server_services(server_name)
 
     if not services and not server.location:
-        await callback.message.edit_text(
+        await safe_edit(
+            callback.message,
             f"🗺️ <b>Карта {server_name}</b>\n\n"
             "ℹ️ Информация о сервере ещё не заполнена.\n\n"
             f"📍 Host: <code>{server.host}</code>\n"
@@ -674,7 +535,8 @@ async def cb_server_map(callback: CallbackQuery):
         )
     else:
         text = format_server_map(server, services)
-        await callback.message.edit_text(
+        await safe_edit(
+            callback.message,
             text,
             reply_markup=server_actions_keyboard(server_name),
             parse_mode="HTML"
@@ -686,7 +548,8 @@ async def cb_server_map(callback: CallbackQuery):
 async def cb_add_server(callback: CallbackQuery, state: FSMContext):
     """Start adding a server"""
     await state.set_state(AddServerStates.name)
-    await callback.message.edit_text(
+    await safe_edit(
+        callback.message,
         "➕ <b>Добавление сервера</b>\n\n"
         "Введите имя сервера (например: production, dev-1):",
         parse_mode="HTML"
@@ -697,7 +560,8 @@ async def cb_add_server(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "settings")
 async def cb_settings(callback: CallbackQuery):
     """Show settings menu"""
-    await callback.message.edit_text(
+    await safe_edit(
+        callback.message,
         "⚙️ <b>Настройки</b>",
         reply_markup=settings_keyboard(),
         parse_mode="HTML"
@@ -766,12 +630,34 @@ async def add_server_port(message: Message, state: FSMContext):
 
 @router.message(AddServerStates.username)
 async def add_server_username(message: Message, state: FSMContext):
-    """Process username and save server"""
+    """Process username"""
     if message.text == "/skip":
         username = "root"
     else:
         username = message.text.strip()
     
+    await state.update_data(username=username)
+    await state.set_state(AddServerStates.country)
+    await message.answer(
+        f"✅ Пользователь: <b>{username}</b>\n\n"
+        "Введите страну сервера для флага "
+        f"({', '.join(COUNTRY_FLAGS)}).\n"
+        "Нажмите /skip, чтобы пропустить.",
+        parse_mode="HTML"
+    )
+
+
+@router.message(AddServerStates.country)
+async def add_server_country(message: Message, state: FSMContext):
+    """Process country and save server"""
+    if message.text == "/skip":
+        country = None
+    else:
+        country = message.text.strip()
+        if country not in COUNTRY_FLAGS:
+            await message.answer("❌ Неизвестная страна. Введите страну из списка или /skip")
+            return
+    
     data = await state.get_data()
     
     # Create server
@@ -780,27 +666,156 @@ async def add_server_username(message: Message, state: FSMContext):
         name=data["name"],
         host=data["host"],
         port=data["port"],
-        username=username
+        username=data["username"],
+        country=country
+    )
+    
+    if await _save_new_server(message, server):
+        await state.clear()
+
+
+# ============== Helper Functions ==============
+
+async def _run_opt(server: Server, kind: str, message: Message):
+    """Run a cleanup and replace the progress message with its result"""
+    server_name = server.name
+    try:
+        ssh = await ssh_pool.acquire_server(server)
+        if kind == "all":
+            sections = await run_all_optimizations(ssh)
+            invalidate(server_name)
+            lines = [f"🛠 <b>Оптимизация {server_name}</b>", ""]
+            for section, result in sections.items():
+                if result.success:
+                    lines.append(f"✅ {_OPT_LABELS[section]}")
+                else:
+                    lines.append(f"❌ {_OPT_LABELS[section]}: {result.error or f'код {result.exit_code}'}")
+            text = "\n".join(lines)
+        else:
+            max_output = None if kind == "journal" else MAX_OUTPUT_BYTES
+            result = await ssh.execute(OPTIMIZE_COMMANDS[kind], max_output_bytes=max_output)
+            invalidate(server_name)
+            text = _format_opt_result(kind, server_name, result)
+    except Exception as e:
+        logger.error(f"Error running {kind} cleanup on {server_name}: {e}")
+        text = f"❌ Ошибка: {str(e)}"
+
+    try:
+        await safe_edit(
+            message,
+            text,
+            reply_markup=optimize_keyboard(server_name),
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        logger.error(f"Failed to show {kind} cleanup result for {server_name}: {e}")
+
+
+def _format_opt_result(kind: str, server_name: str, result: SSHResult) -> str:
+    """Result text for a single cleanup command"""
+    if kind == "journal":
+        if not result.success:
+            return f"❌ Ошибка: {result.stderr}"
+        # Parse freed space from output
+        match = _FREED_RE.search(result.stdout)
+        freed = match.group(1) if match else "some space"
+        return (
+            f"✅ <b>Журналы очищены на {server_name}</b>\n\n"
+            f"Освобождено: {freed}"
+        )
+    if kind == "cache":
+        return (
+            f"✅ <b>Кэш очищен на {server_name}</b>\n\n"
+            "Очищено:\n"
+            "• APT кэш\n"
+            "• /tmp\n"
+            "• /var/tmp"
+        )
+    if kind == "logs":
+        return (
+            f"✅ <b>Логи очищены на {server_name}</b>\n\n"
+            "Очищено:\n"
+            "• Архивы логов (.gz, .1, .old)\n"
+            "• Текущие лог-файлы обрезаны"
+        )
+    return (
+        f"✅ <b>Старые пакеты удалены на {server_name}</b>\n\n"
+        f"<code>{result.stdout[:500]}</code>"
     )
+
+
+def _validate_server_fields(
+    name: str,
+    host: str,
+    port: str = "22",
+    username: str = "root",
+    country: Optional[str] = None
+) -> Union[Server, str]:
+    """Build a Server from raw fields, or return an error message"""
+    try:
+        port_num = int(port)
+    except ValueError:
+        return "❌ Порт должен быть числом"
+    if not 0 < port_num < 65536:
+        return "❌ Порт должен быть от 1 до 65535"
+    if country is not None and country not in COUNTRY_FLAGS:
+        return f"❌ Неизвестная страна. Доступны: {', '.join(COUNTRY_FLAGS)}"
     
+    return Server(
+        id=None,
+        name=name,
+        host=host,
+        port=port_num,
+        username=username,
+        country=country
+    )
+
+
+async def _save_new_server(message: Message, server: Server) -> bool:
+    """Insert server and confirm to the user"""
     try:
         await db.add_server(server)
-        await state.clear()
         
         await message.answer(
             f"✅ <b>Сервер добавлен!</b>\n\n"
-            f"📍 {server.name}\n"
+            f"{server.flag} {server.name}\n"
             f"🌐 {server.host}:{server.port}\n"
             f"👤 {server.username}\n\n"
             "Хотите проверить подключение?",
             reply_markup=server_actions_keyboard(server.name),
             parse_mode="HTML"
         )
+        return True
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
+        return False
 
 
-# ============== Helper Functions ==============
+def _progress_bar(done: int, total: int) -> str:
+    """Progress bar, scaled down when there are more servers than bar cells"""
+    if total > _BAR_WIDTH:
+        done, total = done * _BAR_WIDTH // total, _BAR_WIDTH
+    return _BAR_FULL[:done] + _BAR_EMPTY[:total - done]
+
+
+def _render_server_list(servers: list[Server]) -> str:
+    """Build servers list text: status, flag, IP, name"""
+    return "🖥 <b>Серверы:</b>\n\n" + "\n".join(
+        f"{_STATUS_EMOJI.get(status, '⚪')} {flag} <code>{host}</code> — {name}"
+        for name, host, status, flag in map(_server_fields, servers)
+    )
+
+
+async def _check_one(server: Server) -> tuple[Server, Optional[HealthReport]]:
+    """Check a single server within the concurrency limit"""
+    try:
+        async with _check_semaphore():
+            report = await get_report(server)
+        return server, report
+    except Exception as e:
+        logger.error(f"Error checking {server.name}: {e}")
+        return server, None
+
 
 async def check_server_by_name(message: Message, server_name: str):
     """Check server by name and send report"""
@@ -813,16 +828,7 @@ async def check_server_by_name(message: Message, server_name: str):
     await message.answer(f"🔄 Проверяю {server_name}...")
     
     try:
-        if server.host == "localhost":
-            report = await check_local_server(server.name)
-        else:
-            report = await check_remote_server(
-                host=server.host,
-                name=server.name,
-                port=server.port,
-                username=server.username,
-                key_path=server.key_path
-            )
+        report = await get_report(server)
         
         await db.update_last_check(server_name, report.overall_status)
 
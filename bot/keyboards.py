@@ -1,25 +1,24 @@
 """
 Telegram inline keyboards
 """
+import functools
+from operator import attrgetter
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 
-# Country flags mapping
-COUNTRY_FLAGS = {
-    "USA": "🇺🇸",
-    "Finland": "🇫🇮",
-    "Germany": "🇩🇪",
-    "Netherlands": "🇳🇱",
-    "Russia": "🇷🇺",
-    "UK": "🇬🇧",
-    "France": "🇫🇷",
-    "Canada": "🇨🇦",
-    "Japan": "🇯🇵",
-    "Singapore": "🇸🇬",
-}
+# Server status emoji (None = never checked)
+_STATUS_EMOJI = {"ok": "🟢", "warning": "🟡", "critical": "🔴", None: "⚪"}
+
+# Fields shown per server button
+_server_fields = attrgetter("name", "last_status", "flag")
 
+# Keyboards built only from hashable arguments are cached with lru_cache,
+# so the returned markup is shared and must not be modified by callers.
 
+
+@functools.lru_cache(maxsize=1)
 def main_menu_keyboard() -> InlineKeyboardMarkup:
     """Main menu keyboard"""
     builder = InlineKeyboardBuilder()
@@ -38,18 +37,10 @@ def servers_list_keyboard(servers: list, action: str = "check") -> InlineKeyboar
     """Keyboard with list of servers"""
     builder = InlineKeyboardBuilder()
 
-    for server in servers:
-        status_emoji = {
-            "ok": "🟢",
-            "warning": "🟡",
-            "critical": "🔴",
-            None: "⚪"
-        }.get(server.last_status, "⚪")
-        flag = COUNTRY_FLAGS.get(server.name, "🌐")
-
+    for name, status, flag in map(_server_fields, servers):
         builder.row(InlineKeyboardButton(
-            text=f"{status_emoji} {flag} {server.name}",
-            callback_data=f"{action}:{server.name}"
+            text=f"{_STATUS_EMOJI.get(status, '⚪')} {flag} {name}",
+            callback_data=f"{action}:{name}"
         ))
 
     builder.row(
@@ -59,6 +50,7 @@ def servers_list_keyboard(servers: list, action: str = "check") -> InlineKeyboar
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=128)
 def server_actions_keyboard(server_name: str) -> InlineKeyboardMarkup:
     """Actions for a specific server"""
     builder = InlineKeyboardBuilder()
@@ -78,11 +70,12 @@ def server_actions_keyboard(server_name: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=128)
 def report_actions_keyboard(server_name: str) -> InlineKeyboardMarkup:
     """Actions after viewing report"""
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="🔄 Обновить", callback_data=f"check:{server_name}"),
+        InlineKeyboardButton(text="🔄 Обновить", callback_data=f"refresh:{server_name}"),
         InlineKeyboardButton(text="📊 Процессы", callback_data=f"processes:{server_name}")
     )
     builder.row(
@@ -92,6 +85,7 @@ def report_actions_keyboard(server_name: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=128)
 def optimize_keyboard(server_name: str) -> InlineKeyboardMarkup:
     """Optimization options"""
     builder = InlineKeyboardBuilder()
@@ -103,10 +97,12 @@ def optimize_keyboard(server_name: str) -> InlineKeyboardMarkup:
         InlineKeyboardButton(text="🔄 Очистить journal", callback_data=f"opt_journal:{server_name}"),
         InlineKeyboardButton(text="📦 Удалить старые пакеты", callback_data=f"opt_packages:{server_name}")
     )
+    builder.row(InlineKeyboardButton(text="🚀 Всё сразу", callback_data=f"opt_all:{server_name}"))
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data=f"server:{server_name}"))
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=128)
 def confirm_keyboard(action: str, server_name: str) -> InlineKeyboardMarkup:
     """Confirmation keyboard"""
     builder = InlineKeyboardBuilder()
@@ -117,6 +113,7 @@ def confirm_keyboard(action: str, server_name: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=1)
 def settings_keyboard() -> InlineKeyboardMarkup:
     """Settings menu"""
     builder = InlineKeyboardBuilder()
@@ -131,6 +128,7 @@ def settings_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@functools.lru_cache(maxsize=128)
 def schedule_keyboard(current_interval: int) -> InlineKeyboardMarkup:
     """Schedule settings keyboard"""
     builder = InlineKeyboardBuilder()
@@ -0,0 +1,112 @@
+"""
+Report cache - short-lived in-memory cache of health reports per server
+"""
+import asyncio
+import time
+from typing import Optional
+
+from database.db import Server
+from core.health_checker import HealthReport, check_local_server, check_remote_server
+
+
+# Seconds a report stays fresh
+DEFAULT_TTL = 30
+
+# Freshness for scheduled checks, so overlapping ticks and UI requests share one check
+SCHEDULER_TTL = 90
+
+# Critical and failed reports are re-probed sooner, whatever ttl was asked for
+PROBLEM_TTL = 9
+_PROBLEM_STATUSES = frozenset({"critical", "error"})
+
+_CACHE: dict[str, tuple[float, HealthReport]] = {}
+_INFLIGHT: dict[str, asyncio.Future] = {}
+
+
+async def _fetch(server: Server, auto_clean: bool = False) -> HealthReport:
+    """Run a fresh health check for server"""
+    if server.host == "localhost":
+        return await check_local_server(server.name, auto_clean=auto_clean)
+    return await check_remote_server(
+        host=server.host,
+        name=server.name,
+        port=server.port,
+        username=server.username,
+        key_path=server.key_path,
+        auto_clean=auto_clean
+    )
+
+
+def _fresh(name: str, ttl: float) -> Optional[HealthReport]:
+    """Get cached report if it is younger than ttl"""
+    entry = _CACHE.get(name)
+    if entry is None:
+        return None
+    checked_at, report = entry
+    if report.overall_status in _PROBLEM_STATUSES:
+        ttl = min(ttl, PROBLEM_TTL)
+    if time.monotonic() - checked_at < ttl:
+        return report
+    return None
+
+
+def last_report(name: str) -> Optional[HealthReport]:
+    """Most recent cached report for server, however old"""
+    entry = _CACHE.get(name)
+    return entry[1] if entry else None
+
+
+async def get_report(
+    server: Server,
+    *,
+    force: bool = False,
+    ttl: float = DEFAULT_TTL,
+    auto_clean: bool = False
+) -> HealthReport:
+    """Get health report for server, reusing a recent one unless force is set
+    
+    auto_clean always runs a new check (with cleanup in the same SSH call).
+    """
+    if auto_clean:
+        # Cleanup has side effects, so don't reuse or join another check
+        report = await _fetch(server, auto_clean=True)
+        _CACHE[server.name] = (time.monotonic(), report)
+        return report
+
+    if not force:
+        report = _fresh(server.name, ttl)
+        if report:
+            return report
+
+    # Join a check that is already running instead of starting another one
+    inflight = _INFLIGHT.get(server.name)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    fut = asyncio.get_running_loop().create_future()
+    _INFLIGHT[server.name] = fut
+    try:
+        report = await _fetch(server)
+        _CACHE[server.name] = (time.monotonic(), report)
+        fut.set_result(report)
+        return report
+    except Exception as e:
+        fut.set_exception(e)
+        # Mark retrieved so an unawaited future doesn't log a warning
+        fut.exception()
+        raise
+    except asyncio.CancelledError:
+        # The owner was cancelled (e.g. by a scheduler timeout): fail callers that
+        # joined this check with an error they can handle instead of cancelling them
+        fut.set_exception(TimeoutError(f"Health check of {server.name} was interrupted"))
+        fut.exception()
+        raise
+    finally:
+        if not fut.done():
+            fut.cancel()
+        _INFLIGHT.pop(server.name, None)
+
+
+def invalidate(name: str) -> None:
+    """Drop cached report for server"""
+    _CACHE.pop(name, None)
@@ -0,0 +1,113 @@
+"""
+Throttled message editing - keeps message edits within Telegram rate limits
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Used when PROGRESS_EDIT_INTERVAL_MS is not a sane value
+DEFAULT_EDIT_INTERVAL = 1.0
+
+# Lower bound, so a tiny setting can't turn trailing edits into a busy loop
+MIN_EDIT_INTERVAL = 0.1
+
+# Hash of the last content sent to each (chat_id, message_id)
+_LAST_RENDER: dict[tuple[int, int], int] = {}
+_LAST_RENDER_MAX = 1000
+
+
+async def safe_edit(message: Message, text: str, **kwargs) -> None:
+    """Edit message text, skipping the API call if the content is unchanged"""
+    key = (message.chat.id, message.message_id)
+    content = hash((text, str(kwargs.get("reply_markup"))))
+    if _LAST_RENDER.get(key) == content:
+        return
+
+    try:
+        await message.edit_text(text, **kwargs)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+
+    # Re-insert so the oldest entries are evicted first
+    _LAST_RENDER.pop(key, None)
+    _LAST_RENDER[key] = content
+    if len(_LAST_RENDER) > _LAST_RENDER_MAX:
+        del _LAST_RENDER[next(iter(_LAST_RENDER))]
+
+
+def edit_interval() -> float:
+    """Minimum delay between progress edits in seconds"""
+    interval = get_settings().progress_edit_interval_ms / 1000
+    if not math.isfinite(interval) or interval < 0:
+        return DEFAULT_EDIT_INTERVAL
+    return max(interval, MIN_EDIT_INTERVAL)
+
+
+class ThrottledEditor:
+    """Coalesces edits of one message to at most one per interval"""
+
+    def __init__(self, message: Message, interval: Optional[float] = None):
+        self.message = message
+        self.interval = edit_interval() if interval is None else interval
+        self._last_edit = 0.0
+        self._pending: Optional[tuple[str, dict]] = None
+        self._trailing: Optional[asyncio.Task] = None
+        # Edits are sent one at a time, so a late progress edit can't land after the final text
+        self._send_lock = asyncio.Lock()
+
+    async def update(self, text: str, **kwargs) -> None:
+        """Edit the message now, or later if the last edit was too recent"""
+        self._pending = (text, kwargs)
+        remaining = self.interval - (time.monotonic() - self._last_edit)
+        if remaining <= 0:
+            await self._send_pending()
+        elif self._trailing is None:
+            self._trailing = asyncio.create_task(self._send_later(remaining))
+
+    async def flush(self, text: Optional[str] = None, **kwargs) -> None:
+        """Drop any delayed edit and send the latest (or given) text after an edit in flight"""
+        if self._trailing is not None:
+            self._trailing.cancel()
+            self._trailing = None
+        if text is not None:
+            self._pending = (text, kwargs)
+        await self._send_pending()
+
+    async def _send_later(self, delay: float) -> None:
+        """Send pending edits once the interval has passed, until none are left"""
+        try:
+            while self._pending is not None:
+                await asyncio.sleep(delay)
+                # Shielded: flush() cancels this task but must not abort an edit on its way
+                await asyncio.shield(self._send_trailing())
+                delay = self.interval
+        finally:
+            if self._trailing is asyncio.current_task():
+                self._trailing = None
+
+    async def _send_trailing(self) -> None:
+        """Send the pending edit, logging failures"""
+        try:
+            await self._send_pending()
+        except Exception as e:
+            logger.warning(f"Failed to update progress message: {e}")
+
+    async def _send_pending(self) -> None:
+        """Send the most recent pending edit, after any edit still in flight"""
+        async with self._send_lock:
+            if self._pending is None:
+                return
+            text, kwargs = self._pending
+            self._pending = None
+            self._last_edit = time.monotonic()
+            await safe_edit(self.message, text, **kwargs)
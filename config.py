@@ -1,6 +1,7 @@
 """
 Configuration module for Server Health Bot
 """
+import functools
 import os
 from pathlib import Path
 from pydantic_settings import BaseSettings
@@ -24,6 +25,11 @@ class Settings(BaseSettings):
     # Scheduler
     check_interval_hours: int = Field(6, env="CHECK_INTERVAL_HOURS")
     alert_check_interval_minutes: int = Field(15, env="ALERT_CHECK_INTERVAL_MINUTES")
+    alert_silence_minutes: int = Field(60, env="ALERT_SILENCE_MINUTES")
+    max_parallel_checks: int = Field(8, env="MAX_PARALLEL_CHECKS")
+    
+    # Telegram progress messages
+    progress_edit_interval_ms: float = Field(1000, env="PROGRESS_EDIT_INTERVAL_MS")
     
     # Thresholds
     cpu_warning: int = Field(70, env="CPU_WARNING")
@@ -43,14 +49,14 @@ class Settings(BaseSettings):
         env_file = ".env"
         env_file_encoding = "utf-8"
     
-    @property
+    @functools.cached_property
     def expanded_ssh_key_path(self) -> Path:
-        """Expand ~ in SSH key path"""
+        """Expand ~ in SSH key path (computed once per Settings instance)"""
         return Path(self.ssh_key_path).expanduser()
     
-    @property
+    @functools.cached_property
     def thresholds(self) -> dict:
-        """Get all thresholds as a dict"""
+        """Get all thresholds as a dict (built once per Settings instance)"""
         return {
             "cpu": {"warning": self.cpu_warning, "critical": self.cpu_critical},
             "ram": {"warning": self.ram_warning, "critical": self.ram_critical},
@@ -60,13 +66,22 @@ class Settings(BaseSettings):
 
 
 # Create directories if they don't exist
-def ensure_directories():
-    """Create necessary directories"""
-    dirs = ["./data", "./logs"]
-    for d in dirs:
-        Path(d).mkdir(parents=True, exist_ok=True)
+def ensure_directories(settings: Settings):
+    """Create the database and log directories"""
+    for path in (settings.database_path, settings.log_file):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+
+@functools.lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Global settings instance, created on first call (directories are created once, here)"""
+    settings = Settings()
+    ensure_directories(settings)
+    return settings
 
 
-# Global settings instance
-settings = Settings()
-ensure_directories()
+def __getattr__(name: str):
+    """Keep `from config import settings` working (PEP 562)"""
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,38 @@
+"""
+Background tasks - keeps fire-and-forget tasks referenced and lets shutdown wait for them
+"""
+import asyncio
+import logging
+from typing import Coroutine
+
+logger = logging.getLogger(__name__)
+
+# Strong references, so running tasks aren't garbage collected mid-run
+_TASKS: set[asyncio.Task] = set()
+
+
+def _on_done(task: asyncio.Task) -> None:
+    """Drop the reference and log an unhandled error"""
+    _TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} failed: {task.exception()}")
+
+
+def spawn(coro: Coroutine, name: str = None) -> asyncio.Task:
+    """Start coro as a background task that is kept alive until it finishes"""
+    task = asyncio.create_task(coro, name=name)
+    _TASKS.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+async def drain(timeout: float) -> None:
+    """Wait up to timeout seconds for background tasks, then cancel the rest"""
+    if not _TASKS:
+        return
+    logger.info(f"Waiting for {len(_TASKS)} background task(s)")
+    done, pending = await asyncio.wait(set(_TASKS), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,20 @@
+"""
+Country flags for server locations
+"""
+
+# Country flags mapping
+COUNTRY_FLAGS = {
+    "USA": "🇺🇸",
+    "Finland": "🇫🇮",
+    "Germany": "🇩🇪",
+    "Netherlands": "🇳🇱",
+    "Russia": "🇷🇺",
+    "UK": "🇬🇧",
+    "France": "🇫🇷",
+    "Canada": "🇨🇦",
+    "Japan": "🇯🇵",
+    "Singapore": "🇸🇬",
+}
+
+# Shown when country is unknown
+DEFAULT_FLAG = "🌐"
@@ -3,14 +3,19 @@ Health Checker - collects server metrics and analyzes health
 """
 import re
 from dataclasses import dataclass, field
-from typing import Optional
+from types import MappingProxyType
+from typing import NamedTuple, Optional
 from datetime import datetime
 
+import asyncssh
+
+from core import ssh_pool
+from core.optimize import AUTO_CLEAN_COMMAND, parse_auto_clean
 from core.ssh_manager import SSHManager, LocalSSHManager
-from config import settings
+from config import get_settings
 
 
-@dataclass
+@dataclass(slots=True)
 class Metric:
     """Single metric with value and status"""
     name: str
@@ -20,8 +25,7 @@ class Metric:
     details: str = ""
 
 
-@dataclass
-class ProcessInfo:
+class ProcessInfo(NamedTuple):
     """Top process information"""
     pid: int
     user: str
@@ -30,7 +34,7 @@ class ProcessInfo:
     command: str
 
 
-@dataclass
+@dataclass(slots=True)
 class HealthReport:
     """Complete health report for a server"""
     server_name: str
@@ -63,12 +67,99 @@ class HealthReport:
     # Errors during collection
     errors: list[str] = field(default_factory=list)
 
+    # Root disk usage in % after a cleanup run in the same check (None = no cleanup)
+    auto_clean_disk_percent: Optional[int] = None
+
+    @property
+    def disk_percent(self) -> float:
+        """Usage of the fullest disk in % (0 if unknown)"""
+        return max((d.value for d in self.disks), default=0)
+
+
+def empty_report(name: str, timestamp: datetime, error: Optional[str] = None) -> HealthReport:
+    """Report with default values, used when metrics are unavailable"""
+    return HealthReport(
+        server_name=name,
+        hostname="unknown",
+        timestamp=timestamp,
+        uptime="unknown",
+        os_info="unknown",
+        overall_status="error",
+        cpu_load=Metric("CPU Load", 0, "", "error"),
+        cpu_load_per_core=0,
+        ram=Metric("RAM", 0, "%", "error"),
+        swap=Metric("Swap", 0, "%", "ok"),
+        errors=[error] if error else [],
+    )
+
+
+# One df line: target, size, used, avail, pcent (pseudo filesystems with "-" don't match)
+_DISK_RE = re.compile(r'^(/\S*)\s+(\d+)\s+(\d+)\s+\d+\s+(\d+)%', re.MULTILINE)
+
+# Bytes per unit
+_KB = 1 << 10
+_MB = 1 << 20
+_GB = 1 << 30
+
+# Megabytes per journalctl --disk-usage size unit ("" = bytes)
+_JOURNAL_UNIT_MB = {"T": _MB, "G": _KB, "M": 1, "K": 1 / _KB, "": 1 / _MB}
+
+# GB per upper-cased docker size suffix (docker prints "kB"),
+# most common first; "B" must stay last since it ends every other suffix
+_DOCKER_UNIT_GB = (
+    ("GB", 1),
+    ("MB", 1 / _KB),
+    ("KB", 1 / _MB),
+    ("TB", _KB),
+    ("B", 1 / _GB),
+)
+
+# Issue rules per HealthReport attribute (a Metric, an optional Metric or a list):
+# (attribute, critical issue, critical recommendation, warning issue)
+_ISSUE_RULES = (
+    ("cpu_load",
+     "🔴 Критическая загрузка CPU: {m.value}",
+     "Найти и оптимизировать тяжёлые процессы",
+     "🟡 Повышенная загрузка CPU: {m.value}"),
+    ("ram",
+     "🔴 Критическое использование RAM: {m.value}%",
+     "Проверить утечки памяти, увеличить swap или RAM",
+     "🟡 Высокое использование RAM: {m.value}%"),
+    ("swap",
+     "🔴 Активное использование Swap: {m.value}%",
+     "Срочно освободить RAM или увеличить память",
+     "🟡 Swap используется: {m.value}%"),
+    ("disks",
+     "🔴 Диск {m.name} заполнен: {m.value}%",
+     "Очистить {m.name}: логи, кэш, старые файлы",
+     "🟡 Диск {m.name} заполняется: {m.value}%"),
+    ("sessions",
+     "🔴 Слишком много сессий: {m.value:.0f}",
+     "Проверить подозрительные подключения, возможна атака",
+     "🟡 Много активных сессий: {m.value:.0f}"),
+    ("docker",
+     "🔴 Docker занимает много места: {m.value}GB",
+     "Очистить Docker: docker system prune -a",
+     "🟡 Docker: {m.value}GB ({m.details})"),
+    ("journal_size",
+     "🔴 Журналы занимают много места: {m.value}MB",
+     "Очистить журналы: journalctl --vacuum-size=200M",
+     "🟡 Журналы: {m.value}MB"),
+)
+
+# Overall status is the worst metric status: critical > warning > error > ok
+_STATUS_RANK = {"ok": 0, "error": 1, "warning": 2, "critical": 3}
+_STATUS_BY_RANK = ("ok", "error", "warning", "critical")
+
+# Used for metric types without configured thresholds
+_DEFAULT_THRESHOLDS = (70, 90)
+
 
 class HealthChecker:
     """Collects and analyzes server health metrics"""
     
-    # Commands for metric collection
-    COMMANDS = {
+    # Commands for metric collection (read-only, the batch script built from it is cached)
+    COMMANDS = MappingProxyType({
         "hostname": "hostname",
         "uptime": "uptime -p 2>/dev/null || uptime",
         "os_info": "cat /etc/os-release | grep -E '^(NAME|VERSION)=' | head -2",
@@ -81,7 +172,7 @@ class HealthChecker:
         "sessions": "who | wc -l",
         "docker": "docker system df --format '{{.Type}}\t{{.Size}}\t{{.Reclaimable}}' 2>/dev/null || echo 'NO_DOCKER'",
         "journal": "journalctl --disk-usage 2>/dev/null | grep -oP '[\\d.]+[KMGT]?' || echo '0'",
-    }
+    })
 
     # Thresholds for sessions (warning if >10, critical if >50)
     SESSION_WARNING = 10
@@ -98,79 +189,69 @@ class HealthChecker:
     def __init__(self, ssh_manager: SSHManager, server_name: str = "server"):
         self.ssh = ssh_manager
         self.server_name = server_name
-        self.thresholds = settings.thresholds
+        self.thresholds = get_settings().thresholds
+        # (warning, critical) per metric type
+        self._th = {
+            metric_type: (th["warning"], th["critical"])
+            for metric_type, th in self.thresholds.items()
+        }
     
     def _get_status(self, value: float, metric_type: str) -> str:
         """Determine status based on thresholds"""
-        th = self.thresholds.get(metric_type, {"warning": 70, "critical": 90})
-        if value >= th["critical"]:
+        warning, critical = self._th.get(metric_type, _DEFAULT_THRESHOLDS)
+        if value >= critical:
             return "critical"
-        elif value >= th["warning"]:
+        elif value >= warning:
             return "warning"
         return "ok"
     
     def _parse_memory(self, output: str) -> tuple[Metric, Metric]:
-        """Parse memory output from free command"""
+        """Parse memory output from free command (Mem: line, then Swap: line)"""
         ram = Metric("RAM", 0, "%", "error", "Failed to parse")
         swap = Metric("Swap", 0, "%", "ok", "No swap")
         
-        for line in output.strip().split("\n"):
-            parts = line.split()
-            if len(parts) >= 3:
-                if parts[0] == "Mem:":
-                    total = int(parts[1])
-                    used = int(parts[2])
-                    if total > 0:
-                        pct = (used / total) * 100
-                        ram = Metric(
-                            "RAM",
-                            round(pct, 1),
-                            "%",
-                            self._get_status(pct, "ram"),
-                            f"{used / (1024**3):.1f}GB / {total / (1024**3):.1f}GB"
-                        )
-                elif parts[0] == "Swap:":
-                    total = int(parts[1])
-                    used = int(parts[2])
-                    if total > 0:
-                        pct = (used / total) * 100
-                        swap = Metric(
-                            "Swap",
-                            round(pct, 1),
-                            "%",
-                            self._get_status(pct, "swap"),
-                            f"{used / (1024**3):.1f}GB / {total / (1024**3):.1f}GB"
-                        )
+        lines = output.splitlines()
+        mem_parts = lines[0].split() if lines else []
+        swap_parts = lines[1].split() if len(lines) > 1 else []
+        
+        if len(mem_parts) >= 3 and mem_parts[0] == "Mem:":
+            ram = self._usage_metric("RAM", "ram", int(mem_parts[1]), int(mem_parts[2])) or ram
+        if len(swap_parts) >= 3 and swap_parts[0] == "Swap:":
+            swap = self._usage_metric("Swap", "swap", int(swap_parts[1]), int(swap_parts[2])) or swap
         
         return ram, swap
     
+    def _usage_metric(self, name: str, metric_type: str, total: int, used: int) -> Optional[Metric]:
+        """Percent-used metric from byte counts, None if total is 0"""
+        if total <= 0:
+            return None
+        pct = (used / total) * 100
+        return Metric(
+            name,
+            round(pct, 1),
+            "%",
+            self._get_status(pct, metric_type),
+            f"{used / _GB:.1f}GB / {total / _GB:.1f}GB"
+        )
+    
     def _parse_disk(self, output: str) -> list[Metric]:
         """Parse disk usage output"""
-        disks = []
-        for line in output.strip().split("\n"):
-            parts = line.split()
-            if len(parts) >= 5:
-                mount = parts[0]
-                total = int(parts[1])
-                used = int(parts[2])
-                pct_str = parts[4].rstrip("%")
-                try:
-                    pct = float(pct_str)
-                    disks.append(Metric(
-                        f"Disk {mount}",
-                        pct,
-                        "%",
-                        self._get_status(pct, "disk"),
-                        f"{used / (1024**3):.1f}GB / {total / (1024**3):.1f}GB"
-                    ))
-                except ValueError:
-                    pass
-        return disks
+        get_status = self._get_status
+        return [
+            Metric(
+                f"Disk {mount}",
+                float(pct),
+                "%",
+                get_status(float(pct), "disk"),
+                f"{int(used) / _GB:.1f}GB / {int(total) / _GB:.1f}GB"
+            )
+            for mount, total, used, pct in _DISK_RE.findall(output)
+        ]
     
     def _parse_processes(self, output: str) -> list[ProcessInfo]:
         """Parse ps aux output"""
         processes = []
-        for line in output.strip().split("\n"):
+        for line in output.splitlines():
             parts = line.split(None, 10)
             if len(parts) >= 11:
                 try:
@@ -189,16 +270,10 @@ class HealthChecker:
         """Parse size string like '3.7GB' or '500MB' to GB"""
         size_str = size_str.strip().upper()
         try:
-            if 'GB' in size_str:
-                return float(size_str.replace('GB', ''))
-            elif 'MB' in size_str:
-                return float(size_str.replace('MB', '')) / 1024
-            elif 'KB' in size_str:
-                return float(size_str.replace('KB', '')) / (1024 * 1024)
-            elif 'B' in size_str:
-                return float(size_str.replace('B', '')) / (1024 * 1024 * 1024)
-            else:
-                return float(size_str)
+            for unit, per_gb in _DOCKER_UNIT_GB:
+                if size_str.endswith(unit):
+                    return float(size_str[:-len(unit)]) * per_gb
+            return float(size_str)
         except ValueError:
             return 0
 
@@ -207,7 +282,7 @@ class HealthChecker:
         total_size_gb = 0
         reclaimable_gb = 0
 
-        for line in output.strip().split("\n"):
+        for line in output.splitlines():
             parts = line.split("\t")
             if len(parts) >= 2:
                 size_str = parts[1] if len(parts) > 1 else "0"
@@ -234,22 +309,14 @@ class HealthChecker:
 
     def _parse_journal(self, output: str) -> Optional[Metric]:
         """Parse journalctl --disk-usage output"""
-        size_mb = 0
-        output = output.strip()
-
         # Parse size like "881.8M" or "1.2G"
-        match = re.search(r'([\d.]+)([KMGT]?)', output)
-        if match:
-            value = float(match.group(1))
-            unit = match.group(2).upper()
-            if unit == 'G':
-                size_mb = value * 1024
-            elif unit == 'M':
-                size_mb = value
-            elif unit == 'K':
-                size_mb = value / 1024
-            else:
-                size_mb = value / (1024 * 1024)
+        size = output.strip().split("\n", 1)[0].strip()
+        unit = size[-1].upper() if size and size[-1].upper() in "KMGT" else ""
+        try:
+            value = float(size[:-1] if unit else size)
+        except ValueError:
+            value = 0.0
+        size_mb = value * _JOURNAL_UNIT_MB[unit]
 
         if size_mb >= self.JOURNAL_CRITICAL_MB:
             status = "critical"
@@ -268,108 +335,57 @@ class HealthChecker:
 
     def _analyze_issues(self, report: HealthReport) -> None:
         """Analyze report and add issues/recommendations"""
-        # CPU
-        if report.cpu_load.status == "critical":
-            report.issues.append(f"🔴 Критическая загрузка CPU: {report.cpu_load.value}")
-            report.recommendations.append("Найти и оптимизировать тяжёлые процессы")
-        elif report.cpu_load.status == "warning":
-            report.issues.append(f"🟡 Повышенная загрузка CPU: {report.cpu_load.value}")
-        
-        # RAM
-        if report.ram.status == "critical":
-            report.issues.append(f"🔴 Критическое использование RAM: {report.ram.value}%")
-            report.recommendations.append("Проверить утечки памяти, увеличить swap или RAM")
-        elif report.ram.status == "warning":
-            report.issues.append(f"🟡 Высокое использование RAM: {report.ram.value}%")
-        
-        # Swap
-        if report.swap.status == "critical":
-            report.issues.append(f"🔴 Активное использование Swap: {report.swap.value}%")
-            report.recommendations.append("Срочно освободить RAM или увеличить память")
-        elif report.swap.status == "warning":
-            report.issues.append(f"🟡 Swap используется: {report.swap.value}%")
+        # Worst status rank seen, resolved to the overall status at the end
+        worst = 0
+        for attr, critical_fmt, recommendation_fmt, warning_fmt in _ISSUE_RULES:
+            value = getattr(report, attr)
+            metrics = value if isinstance(value, list) else (value,) if value else ()
+            for m in metrics:
+                worst = max(worst, _STATUS_RANK.get(m.status, 0))
+                if m.status == "critical":
+                    report.issues.append(critical_fmt.format(m=m))
+                    report.recommendations.append(recommendation_fmt.format(m=m))
+                elif m.status == "warning":
+                    report.issues.append(warning_fmt.format(m=m))
+
+        report.overall_status = _STATUS_BY_RANK[worst]
+
+    async def collect(self, auto_clean: bool = False) -> HealthReport:
+        """Collect all metrics and generate health report
         
-        # Disks
-        for disk in report.disks:
-            if disk.status == "critical":
-                report.issues.append(f"🔴 Диск {disk.name} заполнен: {disk.value}%")
-                report.recommendations.append(f"Очистить {disk.name}: логи, кэш, старые файлы")
-            elif disk.status == "warning":
-                report.issues.append(f"🟡 Диск {disk.name} заполняется: {disk.value}%")
-
-        # Sessions
-        if report.sessions.status == "critical":
-            report.issues.append(f"🔴 Слишком много сессий: {int(report.sessions.value)}")
-            report.recommendations.append("Проверить подозрительные подключения, возможна атака")
-        elif report.sessions.status == "warning":
-            report.issues.append(f"🟡 Много активных сессий: {int(report.sessions.value)}")
-
-        # Docker
-        if report.docker and report.docker.status == "critical":
-            report.issues.append(f"🔴 Docker занимает много места: {report.docker.value}GB")
-            report.recommendations.append("Очистить Docker: docker system prune -a")
-        elif report.docker and report.docker.status == "warning":
-            report.issues.append(f"🟡 Docker: {report.docker.value}GB ({report.docker.details})")
-
-        # Journal
-        if report.journal_size and report.journal_size.status == "critical":
-            report.issues.append(f"🔴 Журналы занимают много места: {report.journal_size.value}MB")
-            report.recommendations.append("Очистить журналы: journalctl --vacuum-size=200M")
-        elif report.journal_size and report.journal_size.status == "warning":
-            report.issues.append(f"🟡 Журналы: {report.journal_size.value}MB")
-
-        # Determine overall status
-        statuses = [report.cpu_load.status, report.ram.status, report.swap.status, report.sessions.status]
-        if report.docker:
-            statuses.append(report.docker.status)
-        if report.journal_size:
-            statuses.append(report.journal_size.status)
-        statuses.extend([d.status for d in report.disks])
-        
-        if "critical" in statuses:
-            report.overall_status = "critical"
-        elif "warning" in statuses:
-            report.overall_status = "warning"
-        elif "error" in statuses:
-            report.overall_status = "error"
-        else:
-            report.overall_status = "ok"
-    
-    async def collect(self) -> HealthReport:
-        """Collect all metrics and generate health report"""
+        With auto_clean, AUTO_CLEAN_COMMAND runs after the metrics in the same batch.
+        """
         timestamp = datetime.utcnow()
         
-        # Execute all commands
-        results = await self.ssh.execute_multiple(list(self.COMMANDS.values()))
+        # Execute all commands in one round trip
+        commands = self.COMMANDS
+        if auto_clean:
+            commands = {**commands, "auto_clean": AUTO_CLEAN_COMMAND}
+        results = await self.ssh.execute_batch(commands)
+        # One slow probe used up the shared timeout: rerun the probes concurrently, each with
+        # its own. Only over a live connection (a dead host would just time out again), and
+        # never the cleanup, which may still be running from the batch
+        live = self.ssh.is_connected or isinstance(self.ssh, LocalSSHManager)
+        if live and any(r.timed_out for r in results.values()):
+            results = await self.ssh.execute_multiple(self.COMMANDS)
         
         # Initialize report with defaults
-        report = HealthReport(
-            server_name=self.server_name,
-            hostname="unknown",
-            timestamp=timestamp,
-            uptime="unknown",
-            os_info="unknown",
-            overall_status="error",
-            cpu_load=Metric("CPU Load", 0, "", "error"),
-            cpu_load_per_core=0,
-            ram=Metric("RAM", 0, "%", "error"),
-            swap=Metric("Swap", 0, "%", "ok"),
-        )
+        report = empty_report(self.server_name, timestamp)
         
         # Parse hostname
-        r = results.get(self.COMMANDS["hostname"])
+        r = results.get("hostname")
         if r and r.success:
             report.hostname = r.stdout.strip()
         
         # Parse uptime
-        r = results.get(self.COMMANDS["uptime"])
+        r = results.get("uptime")
         if r and r.success:
             report.uptime = r.stdout.strip()
         
         # Parse OS info
-        r = results.get(self.COMMANDS["os_info"])
+        r = results.get("os_info")
         if r and r.success:
-            lines = r.stdout.strip().split("\n")
+            lines = r.stdout.splitlines()
             os_parts = []
             for line in lines:
                 if "=" in line:
@@ -378,14 +394,14 @@ class HealthChecker:
         
         # Parse CPU cores and load
         cores = 1
-        r = results.get(self.COMMANDS["cpu_cores"])
+        r = results.get("cpu_cores")
         if r and r.success:
             try:
                 cores = int(r.stdout.strip())
             except ValueError:
                 pass
         
-        r = results.get(self.COMMANDS["load_avg"])
+        r = results.get("load_avg")
         if r and r.success:
             parts = r.stdout.strip().split()
             if parts:
@@ -404,26 +420,26 @@ class HealthChecker:
                     pass
         
         # Parse memory
-        r = results.get(self.COMMANDS["memory"])
+        r = results.get("memory")
         if r and r.success:
             report.ram, report.swap = self._parse_memory(r.stdout)
         
         # Parse disk
-        r = results.get(self.COMMANDS["disk"])
+        r = results.get("disk")
         if r and r.success:
             report.disks = self._parse_disk(r.stdout)
         
         # Parse top processes
-        r = results.get(self.COMMANDS["top_cpu"])
+        r = results.get("top_cpu")
         if r and r.success:
             report.top_cpu_processes = self._parse_processes(r.stdout)
 
-        r = results.get(self.COMMANDS["top_mem"])
+        r = results.get("top_mem")
         if r and r.success:
             report.top_mem_processes = self._parse_processes(r.stdout)
 
         # Parse sessions
-        r = results.get(self.COMMANDS["sessions"])
+        r = results.get("sessions")
         if r and r.success:
             try:
                 session_count = int(r.stdout.strip())
@@ -444,26 +460,31 @@ class HealthChecker:
                 pass
 
         # Parse Docker usage
-        r = results.get(self.COMMANDS["docker"])
+        r = results.get("docker")
         if r and r.success and "NO_DOCKER" not in r.stdout:
             report.docker = self._parse_docker(r.stdout)
 
         # Parse journal size
-        r = results.get(self.COMMANDS["journal"])
+        r = results.get("journal")
         if r and r.success:
             report.journal_size = self._parse_journal(r.stdout)
 
+        # Disk usage after cleanup (metrics above were taken before it)
+        r = results.get("auto_clean")
+        if r and r.success:
+            report.auto_clean_disk_percent = parse_auto_clean(r.stdout)
+
         # Analyze and add issues/recommendations
         self._analyze_issues(report)
         
         return report
 
 
-async def check_local_server(name: str = "localhost") -> HealthReport:
+async def check_local_server(name: str = "localhost", auto_clean: bool = False) -> HealthReport:
     """Quick check of the current server"""
     ssh = LocalSSHManager()
     checker = HealthChecker(ssh, name)
-    return await checker.collect()
+    return await checker.collect(auto_clean)
 
 
 async def check_remote_server(
@@ -472,15 +493,22 @@ async def check_remote_server(
     port: int = 22,
     username: str = "root",
     key_path: Optional[str] = None,
-    password: Optional[str] = None
+    password: Optional[str] = None,
+    auto_clean: bool = False
 ) -> HealthReport:
-    """Check a remote server via SSH"""
-    ssh = SSHManager(
-        host=host,
-        port=port,
-        username=username,
-        key_path=key_path,
-        password=password
-    )
+    """Check a remote server via SSH (key-based connections are pooled and reused)"""
+    if password:
+        ssh = SSHManager(
+            host=host,
+            port=port,
+            username=username,
+            key_path=key_path,
+            password=password
+        )
+    else:
+        try:
+            ssh = await ssh_pool.acquire(host, port, username, key_path)
+        except (ConnectionError, asyncssh.Error, OSError) as e:
+            return empty_report(name, datetime.utcnow(), f"SSH: {e}")
     checker = HealthChecker(ssh, name)
-    return await checker.collect()
+    return await checker.collect(auto_clean)
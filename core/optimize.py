@@ -0,0 +1,59 @@
+"""
+Optimizer - cleanup commands and batched execution over one SSH call
+"""
+from core.ssh_manager import SSHManager, SSHResult
+
+
+# Cleanup commands by kind
+OPTIMIZE_COMMANDS = {
+    "journal": "journalctl --vacuum-size=200M 2>&1",
+    "cache": (
+        "apt-get clean 2>/dev/null; "
+        "rm -rf /tmp/* 2>/dev/null; "
+        "rm -rf /var/tmp/* 2>/dev/null; "
+        "echo 'OK'"
+    ),
+    "logs": (
+        "find /var/log -name '*.gz' -delete 2>/dev/null; "
+        "find /var/log -name '*.1' -delete 2>/dev/null; "
+        "find /var/log -name '*.old' -delete 2>/dev/null; "
+        "truncate -s 0 /var/log/*.log 2>/dev/null; "
+        "echo 'OK'"
+    ),
+    "packages": "apt-get autoremove -y 2>&1 | tail -5",
+}
+
+# Unattended cleanup (journal + caches) that ends by printing root disk usage in %
+AUTO_CLEAN_COMMAND = (
+    "journalctl --vacuum-size=200M >/dev/null 2>&1; "
+    "apt-get clean 2>/dev/null; "
+    "rm -rf /tmp/* /var/tmp/* 2>/dev/null; "
+    "df / --output=pcent | tail -1 | tr -d ' %'"
+)
+
+# Output kept from a single cleanup command (only a short tail is shown)
+MAX_OUTPUT_BYTES = 4096
+
+
+def parse_auto_clean(stdout: str) -> int:
+    """Root disk usage in % printed at the end of AUTO_CLEAN_COMMAND (0 if missing)"""
+    lines = stdout.strip().splitlines()
+    try:
+        return int(lines[-1]) if lines else 0
+    except ValueError:
+        return 0
+
+
+async def run_all_optimizations(
+    ssh: SSHManager,
+    kinds: tuple[str, ...] = tuple(OPTIMIZE_COMMANDS)
+) -> dict[str, SSHResult]:
+    """Run several cleanup commands in a single SSH execute
+    
+    Each cleanup gets the time it would have had on its own (journal vacuum and
+    apt-get can be slow), so one slow command doesn't fail the whole batch.
+    """
+    return await ssh.execute_batch(
+        {kind: OPTIMIZE_COMMANDS[kind] for kind in kinds},
+        timeout=ssh.timeout * len(kinds)
+    )
@@ -1,25 +1,79 @@
 """
 Report Formatter - formats health reports for Telegram
 """
+from collections import Counter, defaultdict
+from typing import Optional
+
 from core.health_checker import HealthReport, Metric
+from core.flags import DEFAULT_FLAG
 from database.db import Server, ServerService
 
 
+_STATUS_EMOJI = {
+    "ok": "🟢",
+    "warning": "🟡",
+    "critical": "🔴",
+    "error": "⚪"
+}
+
+_SHORT_STATUS_TEXT = {
+    "ok": "Всё в порядке",
+    "warning": "Требует внимания",
+    "critical": "Критическое состояние",
+    "error": "Ошибка проверки"
+}
+
+_FULL_STATUS_TEXT = {
+    "ok": "Хорошее",
+    "warning": "Требует внимания",
+    "critical": "Критическое",
+    "error": "Ошибка проверки"
+}
+
+# Static report chrome shared by the formatters
+_SEP = "━━━━━━━━━━━━━━━━━━━━"
+_HDR_RESOURCES = "💻 <b>Ресурсы:</b>"
+_HDR_ISSUES = f"{_SEP}\n⚠️ <b>Проблемы:</b>"
+_HDR_RECOMMENDATIONS = "💡 <b>Рекомендации:</b>"
+_HDR_ERRORS = "❌ <b>Ошибки сбора:</b>"
+
+# Last full report rendered per server: (report, (host, flag), text). Reports are
+# shared by the report cache and never modified, so identity means same content
+_LAST_FULL_REPORT: dict[str, tuple[HealthReport, Optional[tuple], str]] = {}
+
+# Order of servers in the summary, most urgent first
+_SUMMARY_ORDER = {"critical": 0, "warning": 1, "error": 2, "ok": 3}
+
+_SERVICE_TYPE_EMOJI = {
+    "vpn": "🛡️",
+    "dns": "🚫",
+    "bot": "🤖",
+    "api": "📡",
+    "docker": "🐳",
+    "media": "🎵",
+    "database": "🗄️",
+    "web": "🌐",
+    "monitoring": "📊",
+    "other": "⚙️"
+}
+
+
 def status_emoji(status: str) -> str:
     """Get emoji for status"""
-    return {
-        "ok": "🟢",
-        "warning": "🟡", 
-        "critical": "🔴",
-        "error": "⚪"
-    }.get(status, "⚪")
+    return _STATUS_EMOJI.get(status, "⚪")
+
+
+# Finished bars for the default width, indexed by the number of filled cells
+_BARS_10 = tuple("█" * i + "░" * (10 - i) for i in range(11))
 
 
 def progress_bar(value: float, width: int = 10) -> str:
     """Create a text progress bar"""
-    filled = int(value / 100 * width)
-    empty = width - filled
-    return "█" * filled + "░" * empty
+    # Integer math on the clamped whole percentage (no float division)
+    filled = min(100, max(0, int(value))) * width // 100
+    if width == 10:
+        return _BARS_10[filled]
+    return "█" * filled + "░" * (width - filled)
 
 
 def format_metric_line(metric: Metric, show_bar: bool = True) -> str:
@@ -36,12 +90,7 @@ def format_short_report(report: HealthReport) -> str:
     """Format a short status report"""
     emoji = status_emoji(report.overall_status)
     
-    status_text = {
-        "ok": "Всё в порядке",
-        "warning": "Требует внимания",
-        "critical": "Критическое состояние",
-        "error": "Ошибка проверки"
-    }.get(report.overall_status, "Неизвестно")
+    status_text = _SHORT_STATUS_TEXT.get(report.overall_status, "Неизвестно")
     
     lines = [
         f"🖥 <b>{report.server_name}</b>",
@@ -62,98 +111,107 @@ def format_short_report(report: HealthReport) -> str:
     return "\n".join(lines)
 
 
-def format_full_report(report: HealthReport, server: Server = None) -> str:
-    """Format a full detailed report for Telegram"""
-    emoji = status_emoji(report.overall_status)
-    flag = COUNTRY_FLAGS.get(report.server_name, "🌐")
+def _detail_line(details: str) -> str:
+    """Indented details line under a tree entry, empty if there are no details"""
+    return f"\n│       {details}" if details else ""
 
-    status_text = {
-        "ok": "Хорошее",
-        "warning": "Требует внимания",
-        "critical": "Критическое",
-        "error": "Ошибка проверки"
-    }.get(report.overall_status, "Неизвестно")
 
-    lines = [
-        f"{flag} <b>Server:</b> {report.server_name}",
-    ]
-    if server:
-        lines.append(f"🌐 <b>IP:</b> <code>{server.host}</code>")
-    lines.extend([
-        f"📅 {report.timestamp.strftime('%Y-%m-%d %H:%M')} UTC",
-        f"⏱ {report.uptime}",
-        "",
-        f"📊 <b>Общее состояние:</b> {emoji} {status_text}",
-        "",
-        "━━━━━━━━━━━━━━━━━━━━",
-        "💻 <b>Ресурсы:</b>",
-    ])
+def _list_block(title: str, items: list[str], limit: int) -> str:
+    """Titled bullet list preceded by a blank line, empty if there are no items"""
+    if not items:
+        return ""
+    bullets = "\n".join(f"• {item}" for item in items[:limit])
+    return f"\n\n{title}\n{bullets}"
+
 
+# Full report layout; optional sections are pre-joined blocks that start with "\n"
+_FULL_REPORT_TEMPLATE = "\n".join([
+    "{flag} <b>Server:</b> {server_name}{ip_line}",
+    "📅 {timestamp} UTC",
+    "⏱ {uptime}",
+    "",
+    "📊 <b>Общее состояние:</b> {emoji} {status_text}",
+    "",
+    _SEP,
+    _HDR_RESOURCES,
+    "├ CPU:  {cpu_bar} {cpu_pct:.0f}% {cpu_emoji}",
+    "│       Load: {cpu_value} {cpu_unit}",
+    "├ RAM:  {ram_bar} {ram_value}% {ram_emoji}{ram_details}",
+    "├ Swap: {swap_bar} {swap_value}% {swap_emoji}{swap_details}{disks}",
+    "├ 👥 Sessions: {sessions} users {sessions_emoji}{docker}{journal}{issues}{recommendations}{errors}",
+])
+
+
+def format_full_report(report: HealthReport, server: Server = None) -> str:
+    """Format a full detailed report for Telegram (reuses the last render of the same report)"""
+    # Only the host and flag of the server appear in the text
+    server_key = (server.host, server.flag) if server else None
+    cached = _LAST_FULL_REPORT.get(report.server_name)
+    if cached and cached[0] is report and cached[1] == server_key:
+        return cached[2]
+    text = _render_full_report(report, server)
+    _LAST_FULL_REPORT[report.server_name] = (report, server_key, text)
+    return text
+
+
+def _render_full_report(report: HealthReport, server: Optional[Server]) -> str:
+    """Build the full report text"""
     # CPU (load per core as percentage)
     cpu_pct = min(report.cpu_load_per_core * 100, 100)
-    cpu_bar = progress_bar(cpu_pct)
-    lines.append(f"├ CPU:  {cpu_bar} {cpu_pct:.0f}% {status_emoji(report.cpu_load.status)}")
-    lines.append(f"│       Load: {report.cpu_load.value} {report.cpu_load.unit}")
-
-    # RAM
-    ram_bar = progress_bar(report.ram.value)
-    lines.append(f"├ RAM:  {ram_bar} {report.ram.value}% {status_emoji(report.ram.status)}")
-    if report.ram.details:
-        lines.append(f"│       {report.ram.details}")
-
-    # Swap
-    swap_bar = progress_bar(report.swap.value)
-    lines.append(f"├ Swap: {swap_bar} {report.swap.value}% {status_emoji(report.swap.status)}")
-    if report.swap.details and report.swap.value > 0:
-        lines.append(f"│       {report.swap.details}")
-
-    # Disks
-    for i, disk in enumerate(report.disks):
-        disk_bar = progress_bar(disk.value)
-        disk_name = disk.name.replace("Disk ", "")
-        lines.append(f"├ {disk_name}: {disk_bar} {disk.value}% {status_emoji(disk.status)}")
-        if disk.details:
-            lines.append(f"│       {disk.details}")
+    ram, swap = report.ram, report.swap
 
-    # Sessions
-    lines.append(f"├ 👥 Sessions: {int(report.sessions.value)} users {status_emoji(report.sessions.status)}")
+    disks = "".join(
+        f"\n├ {disk.name.replace('Disk ', '')}: {progress_bar(disk.value)} {disk.value}% "
+        f"{status_emoji(disk.status)}{_detail_line(disk.details)}"
+        for disk in report.disks
+    )
 
-    # Docker (if available)
+    docker = ""
     if report.docker:
-        lines.append(f"├ 🐳 Docker: {report.docker.value}GB {status_emoji(report.docker.status)}")
-        if report.docker.details:
-            lines.append(f"│       {report.docker.details}")
+        docker = (
+            f"\n├ 🐳 Docker: {report.docker.value}GB {status_emoji(report.docker.status)}"
+            f"{_detail_line(report.docker.details)}"
+        )
 
-    # Journal (if available)
+    journal = ""
     if report.journal_size:
-        lines.append(f"└ 📋 Journal: {int(report.journal_size.value)}MB {status_emoji(report.journal_size.status)}")
-    else:
-        # Close the tree if no docker/journal
-        pass
-
-    # Issues
-    if report.issues:
-        lines.append("")
-        lines.append("━━━━━━━━━━━━━━━━━━━━")
-        lines.append("⚠️ <b>Проблемы:</b>")
-        for issue in report.issues[:5]:  # Limit to 5
-            lines.append(f"• {issue}")
-    
-    # Recommendations
-    if report.recommendations:
-        lines.append("")
-        lines.append("💡 <b>Рекомендации:</b>")
-        for rec in report.recommendations[:3]:  # Limit to 3
-            lines.append(f"• {rec}")
-    
-    # Errors
-    if report.errors:
-        lines.append("")
-        lines.append("❌ <b>Ошибки сбора:</b>")
-        for err in report.errors[:3]:
-            lines.append(f"• {err}")
-    
-    return "\n".join(lines)
+        journal = (
+            f"\n└ 📋 Journal: {int(report.journal_size.value)}MB "
+            f"{status_emoji(report.journal_size.status)}"
+        )
+
+    issues = _list_block(_HDR_ISSUES, report.issues, 5)
+
+    return _FULL_REPORT_TEMPLATE.format_map({
+        "flag": server.flag if server else DEFAULT_FLAG,
+        "server_name": report.server_name,
+        "ip_line": f"\n🌐 <b>IP:</b> <code>{server.host}</code>" if server else "",
+        "timestamp": report.timestamp.strftime('%Y-%m-%d %H:%M'),
+        "uptime": report.uptime,
+        "emoji": status_emoji(report.overall_status),
+        "status_text": _FULL_STATUS_TEXT.get(report.overall_status, "Неизвестно"),
+        "cpu_bar": progress_bar(cpu_pct),
+        "cpu_pct": cpu_pct,
+        "cpu_emoji": status_emoji(report.cpu_load.status),
+        "cpu_value": report.cpu_load.value,
+        "cpu_unit": report.cpu_load.unit,
+        "ram_bar": progress_bar(ram.value),
+        "ram_value": ram.value,
+        "ram_emoji": status_emoji(ram.status),
+        "ram_details": _detail_line(ram.details),
+        "swap_bar": progress_bar(swap.value),
+        "swap_value": swap.value,
+        "swap_emoji": status_emoji(swap.status),
+        "swap_details": _detail_line(swap.details) if swap.value > 0 else "",
+        "disks": disks,
+        "sessions": int(report.sessions.value),
+        "sessions_emoji": status_emoji(report.sessions.status),
+        "docker": docker,
+        "journal": journal,
+        "issues": issues,
+        "recommendations": _list_block(_HDR_RECOMMENDATIONS, report.recommendations, 3),
+        "errors": _list_block(_HDR_ERRORS, report.errors, 3),
+    })
 
 
 def format_processes_report(report: HealthReport) -> str:
@@ -176,26 +234,10 @@ def format_processes_report(report: HealthReport) -> str:
     return "\n".join(lines)
 
 
-COUNTRY_FLAGS = {
-    "USA": "🇺🇸",
-    "Finland": "🇫🇮",
-    "Germany": "🇩🇪",
-    "Netherlands": "🇳🇱",
-    "Russia": "🇷🇺",
-    "UK": "🇬🇧",
-    "France": "🇫🇷",
-    "Canada": "🇨🇦",
-    "Japan": "🇯🇵",
-    "Singapore": "🇸🇬",
-}
-
-
 def format_all_servers_summary(reports: list[HealthReport], servers: list = None) -> str:
     """Format summary of all servers"""
     # Build server lookup by name
-    server_lookup = {}
-    if servers:
-        server_lookup = {s.name: s for s in servers}
+    server_lookup = {s.name: s for s in servers} if servers else {}
 
     lines = [
         "📊 <b>Статус всех серверов</b>",
@@ -204,13 +246,13 @@ def format_all_servers_summary(reports: list[HealthReport], servers: list = None
     ]
 
     # Sort by status priority
-    status_order = {"critical": 0, "warning": 1, "error": 2, "ok": 3}
-    sorted_reports = sorted(reports, key=lambda r: status_order.get(r.overall_status, 4))
+    sorted_reports = sorted(reports, key=lambda r: _SUMMARY_ORDER.get(r.overall_status, 4))
+    counts = Counter(r.overall_status for r in reports)
 
     for report in sorted_reports:
         emoji = status_emoji(report.overall_status)
-        flag = COUNTRY_FLAGS.get(report.server_name, "🌐")
         server = server_lookup.get(report.server_name)
+        flag = server.flag if server else DEFAULT_FLAG
         host = f"<code>{server.host}</code>" if server else ""
 
         lines.append(f"{emoji} {flag} {host} <b>{report.server_name}</b>")
@@ -219,30 +261,15 @@ def format_all_servers_summary(reports: list[HealthReport], servers: list = None
         lines.append(f"   CPU: {report.cpu_load.value} | RAM: {report.ram.value}% | Disk: {disk_val} | 👥 {sessions_val}")
     
     # Summary
-    critical = sum(1 for r in reports if r.overall_status == "critical")
-    warning = sum(1 for r in reports if r.overall_status == "warning")
-    ok = sum(1 for r in reports if r.overall_status == "ok")
-    
     lines.append("")
-    lines.append(f"Итого: 🔴 {critical} | 🟡 {warning} | 🟢 {ok}")
+    lines.append(f"Итого: 🔴 {counts['critical']} | 🟡 {counts['warning']} | 🟢 {counts['ok']}")
 
     return "\n".join(lines)
 
 
 def service_type_emoji(service_type: str) -> str:
     """Get emoji for service type"""
-    return {
-        "vpn": "🛡️",
-        "dns": "🚫",
-        "bot": "🤖",
-        "api": "📡",
-        "docker": "🐳",
-        "media": "🎵",
-        "database": "🗄️",
-        "web": "🌐",
-        "monitoring": "📊",
-        "other": "⚙️"
-    }.get(service_type, "⚙️")
+    return _SERVICE_TYPE_EMOJI.get(service_type, "⚙️")
 
 
 def format_server_map(server: Server, services: list[ServerService]) -> str:
@@ -261,8 +288,8 @@ def format_server_map(server: Server, services: list[ServerService]) -> str:
 
     # Resources
     lines.append("")
-    lines.append("━━━━━━━━━━━━━━━━━━━━")
-    lines.append("💻 <b>Ресурсы:</b>")
+    lines.append(_SEP)
+    lines.append(_HDR_RESOURCES)
     if server.cpu_cores:
         lines.append(f"├ CPU: {server.cpu_cores} cores")
     if server.ram_gb:
@@ -270,18 +297,21 @@ def format_server_map(server: Server, services: list[ServerService]) -> str:
     if server.disk_gb:
         lines.append(f"└ Disk: {server.disk_gb} GB")
 
+    # Open ports, collected while grouping services
+    ports = []
+
     # Services grouped by type
     if services:
         lines.append("")
-        lines.append("━━━━━━━━━━━━━━━━━━━━")
+        lines.append(_SEP)
         lines.append("🔧 <b>Сервисы:</b>")
 
         # Group services by type
-        service_groups = {}
+        service_groups = defaultdict(list)
         for svc in services:
-            if svc.service_type not in service_groups:
-                service_groups[svc.service_type] = []
             service_groups[svc.service_type].append(svc)
+            if svc.port:
+                ports.append(svc.port)
 
         for svc_type, svc_list in service_groups.items():
             for svc in svc_list:
@@ -311,10 +341,9 @@ def format_server_map(server: Server, services: list[ServerService]) -> str:
                     lines.append(f"   🐳 <code>{svc.docker_name}</code>")
 
     # Ports summary
-    ports = [svc.port for svc in services if svc.port]
     if ports:
         lines.append("")
-        lines.append("━━━━━━━━━━━━━━━━━━━━")
+        lines.append(_SEP)
         lines.append("🔌 <b>Открытые порты:</b>")
         lines.append(f"   {', '.join(ports)}")
 
@@ -2,12 +2,26 @@
 SSH Manager - handles connections to remote servers
 """
 import asyncio
+import functools
+import os
+import signal
 import asyncssh
-from typing import Optional
+from typing import Iterable, Mapping, Optional
 from dataclasses import dataclass
 from pathlib import Path
 
-from config import settings
+from config import get_settings
+
+
+async def _read_capped(stream, limit: Optional[int]) -> bytes:
+    """Read stream to EOF, keeping at most limit bytes"""
+    if limit is None:
+        return await stream.read()
+    kept = bytearray()
+    while chunk := await stream.read(65536):
+        if len(kept) < limit:
+            kept += chunk[:limit - len(kept)]
+    return bytes(kept)
 
 
 @dataclass
@@ -18,6 +32,44 @@ class SSHResult:
     stderr: str
     exit_code: int
     error: Optional[str] = None
+    timed_out: bool = False
+
+
+# Markers that split the output of a batched script back into commands
+SECTION_MARKER = "---SECTION---"
+RC_PREFIX = "RC:"
+
+# Commands run at once by execute_multiple, the per-command fallback for a timed-out
+# execute_batch (OpenSSH MaxSessions defaults to 10)
+MAX_CONCURRENT_CHANNELS = 8
+
+
+@functools.lru_cache(maxsize=32)
+def build_batch_script(commands: tuple[str, ...]) -> str:
+    """Join commands into one shell script that reports each exit code"""
+    return "\n".join(
+        f"{{ {cmd}; }}; printf '\\n{RC_PREFIX}%s\\n{SECTION_MARKER}\\n' \"$?\""
+        for cmd in commands
+    )
+
+
+def parse_batch_output(keys: Iterable[str], stdout: str) -> dict[str, SSHResult]:
+    """Split batched script output into one result per key"""
+    chunks = stdout.split(SECTION_MARKER + "\n")
+    results = {}
+
+    for i, key in enumerate(keys):
+        lines = chunks[i].rstrip("\n").split("\n") if i < len(chunks) else []
+        rc_line = lines.pop() if lines else ""
+        body = "\n".join(lines).rstrip("\n")
+        try:
+            exit_code = int(rc_line[len(RC_PREFIX):])
+        except ValueError:
+            results[key] = SSHResult(False, body, "", -1, "Section did not complete")
+            continue
+        results[key] = SSHResult(exit_code == 0, body, "", exit_code)
+
+    return results
 
 
 class SSHManager:
@@ -35,38 +87,137 @@ class SSHManager:
         self.host = host
         self.port = port
         self.username = username
-        self.key_path = key_path or str(settings.expanded_ssh_key_path)
+        self.key_path = key_path or str(get_settings().expanded_ssh_key_path)
+        # Checked once here instead of on every connect
+        self._key_exists = Path(self.key_path).exists()
         self.password = password
-        self.timeout = timeout or settings.ssh_timeout
+        self.timeout = timeout or get_settings().ssh_timeout
+        self._conn: Optional[asyncssh.SSHClientConnection] = None
+        # Serializes opening/closing the persistent connection between concurrent callers
+        self._conn_lock = asyncio.Lock()
     
-    async def execute(self, command: str) -> SSHResult:
-        """Execute a command on the remote server"""
+    def _connect_options(self) -> dict:
+        """Build asyncssh connection options"""
+        connect_options = {
+            "host": self.host,
+            "port": self.port,
+            "username": self.username,
+            "known_hosts": None,  # Skip host key verification (for simplicity)
+            # Keep long-lived connections alive through NATs and detect dead peers
+            "keepalive_interval": 30,
+            "keepalive_count_max": 3,
+        }
+        
+        # Add authentication
+        if self.password:
+            connect_options["password"] = self.password
+        elif self._key_exists:
+            connect_options["client_keys"] = [self.key_path]
+        
+        return connect_options
+    
+    @property
+    def is_connected(self) -> bool:
+        """Whether a persistent connection is open"""
+        return self._conn is not None and not self._conn.is_closed()
+    
+    async def connect(self) -> None:
+        """Open a persistent connection reused by execute() until close()"""
+        async with self._conn_lock:
+            if not self.is_connected:
+                await self._open()
+    
+    async def close(self) -> None:
+        """Close the persistent connection if open"""
+        async with self._conn_lock:
+            await self._discard()
+    
+    async def _open(self) -> None:
+        """Replace the persistent connection with a new one (caller holds _conn_lock)"""
+        await self._discard()
         try:
-            # Prepare connection options
-            connect_options = {
-                "host": self.host,
-                "port": self.port,
-                "username": self.username,
-                "known_hosts": None,  # Skip host key verification (for simplicity)
-            }
-            
-            # Add authentication
-            if self.password:
-                connect_options["password"] = self.password
-            elif Path(self.key_path).exists():
-                connect_options["client_keys"] = [self.key_path]
-            
-            # Connect and execute
             async with asyncio.timeout(self.timeout):
-                async with asyncssh.connect(**connect_options) as conn:
-                    result = await conn.run(command, check=False)
-                    
-                    return SSHResult(
-                        success=result.exit_status == 0,
-                        stdout=result.stdout or "",
-                        stderr=result.stderr or "",
-                        exit_code=result.exit_status or 0
-                    )
+                self._conn = await asyncssh.connect(**self._connect_options())
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"Connection timeout ({self.timeout}s)")
+    
+    async def _discard(self) -> None:
+        """Close and forget the persistent connection (caller holds _conn_lock)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+            await conn.wait_closed()
+    
+    async def _reconnect(self, stale: Optional[asyncssh.SSHClientConnection]) -> asyncssh.SSHClientConnection:
+        """Reopen a dropped connection, unless another caller already did"""
+        async with self._conn_lock:
+            if self._conn is stale or not self.is_connected:
+                await self._open()
+            return self._conn
+    
+    async def _run(
+        self,
+        conn: asyncssh.SSHClientConnection,
+        command: str,
+        max_output_bytes: Optional[int]
+    ) -> SSHResult:
+        """Run command on an open connection"""
+        if max_output_bytes is None:
+            result = await conn.run(command, check=False)
+            return SSHResult(
+                success=result.exit_status == 0,
+                stdout=result.stdout or "",
+                stderr=result.stderr or "",
+                exit_code=result.exit_status or 0
+            )
+        
+        # Drain the channel but only keep the first max_output_bytes of each stream
+        async with conn.create_process(command, encoding=None) as proc:
+            stdout, stderr = await asyncio.gather(
+                _read_capped(proc.stdout, max_output_bytes),
+                _read_capped(proc.stderr, max_output_bytes)
+            )
+            await proc.wait(check=False)
+        return SSHResult(
+            success=proc.exit_status == 0,
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+            exit_code=proc.exit_status or 0
+        )
+    
+    async def _run_persistent(self, command: str, max_output_bytes: Optional[int]) -> SSHResult:
+        """Run command on the persistent connection, reconnecting once if it went stale"""
+        conn = self._conn
+        if conn is not None and not conn.is_closed():
+            try:
+                return await self._run(conn, command, max_output_bytes)
+            except (asyncssh.Error, OSError):
+                if not conn.is_closed():
+                    raise
+        # Connection dropped (server restart, NAT timeout) - reconnect and retry once
+        conn = await self._reconnect(conn)
+        return await self._run(conn, command, max_output_bytes)
+    
+    async def execute(
+        self,
+        command: str,
+        max_output_bytes: Optional[int] = None,
+        timeout: Optional[int] = None
+    ) -> SSHResult:
+        """Execute a command on the remote server (asyncssh, never blocks the event loop)
+        
+        max_output_bytes caps how much of stdout/stderr is kept in memory,
+        timeout overrides SSH_TIMEOUT for this command.
+        """
+        timeout = timeout or self.timeout
+        try:
+            async with asyncio.timeout(timeout):
+                if self.is_connected:
+                    # Reuse persistent connection
+                    return await self._run_persistent(command, max_output_bytes)
+                # One-off connection
+                async with asyncssh.connect(**self._connect_options()) as conn:
+                    return await self._run(conn, command, max_output_bytes)
         
         except asyncio.TimeoutError:
             return SSHResult(
@@ -74,7 +225,8 @@ class SSHManager:
                 stdout="",
                 stderr="",
                 exit_code=-1,
-                error=f"Connection timeout ({self.timeout}s)"
+                error=f"Connection timeout ({timeout}s)",
+                timed_out=True
             )
         except asyncssh.Error as e:
             return SSHResult(
@@ -98,12 +250,48 @@ class SSHManager:
         result = await self.execute("echo 'OK'")
         return result.success and "OK" in result.stdout
     
-    async def execute_multiple(self, commands: list[str]) -> dict[str, SSHResult]:
-        """Execute multiple commands and return results by command"""
-        results = {}
-        for cmd in commands:
-            results[cmd] = await self.execute(cmd)
-        return results
+    async def execute_batch(
+        self,
+        commands: Mapping[str, str],
+        timeout: Optional[int] = None
+    ) -> dict[str, SSHResult]:
+        """Execute {key: command} as one script in a single round trip
+        
+        Each result carries its command's stdout and exit code; stderr is not split
+        per command. If the whole call fails, every key gets that result.
+        """
+        result = await self.execute(build_batch_script(tuple(commands.values())), timeout=timeout)
+        if result.error:
+            return {key: result for key in commands}
+        return parse_batch_output(commands, result.stdout)
+    
+    async def execute_multiple(self, commands: dict[str, str]) -> dict[str, SSHResult]:
+        """Execute {key: command} concurrently over a single connection, results by the same keys
+        
+        The connection is checked (and reopened if it dropped) once, under the connection
+        lock, before any channel is opened, so the channels don't each try to reconnect.
+        A connection opened here for a manager that had none is closed afterwards.
+        """
+        opened = self._conn is None
+        try:
+            await self.connect()
+        except (ConnectionError, asyncssh.Error, OSError) as e:
+            error = SSHResult(False, "", "", -1, f"SSH error: {str(e)}")
+            return {key: error for key in commands}
+        
+        # Channels multiplex over one connection; stay below the server's session limit
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHANNELS)
+        
+        async def run(cmd: str) -> SSHResult:
+            async with semaphore:
+                return await self.execute(cmd)
+        
+        try:
+            results = await asyncio.gather(*(run(cmd) for cmd in commands.values()))
+            return dict(zip(commands, results))
+        finally:
+            if opened:
+                await self.close()
 
 
 class LocalSSHManager(SSHManager):
@@ -116,17 +304,32 @@ class LocalSSHManager(SSHManager):
             username="root"
         )
     
-    async def execute(self, command: str) -> SSHResult:
+    async def connect(self) -> None:
+        """Nothing to connect, commands run as local subprocesses"""
+    
+    async def execute(
+        self,
+        command: str,
+        max_output_bytes: Optional[int] = None,
+        timeout: Optional[int] = None
+    ) -> SSHResult:
         """Execute command locally using subprocess"""
+        timeout = timeout or self.timeout
+        proc = None
         try:
             proc = await asyncio.create_subprocess_shell(
                 command,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
             )
             
-            async with asyncio.timeout(self.timeout):
-                stdout, stderr = await proc.communicate()
+            async with asyncio.timeout(timeout):
+                stdout, stderr = await asyncio.gather(
+                    _read_capped(proc.stdout, max_output_bytes),
+                    _read_capped(proc.stderr, max_output_bytes)
+                )
+                await proc.wait()
                 
                 return SSHResult(
                     success=proc.returncode == 0,
@@ -136,12 +339,20 @@ class LocalSSHManager(SSHManager):
                 )
         
         except asyncio.TimeoutError:
+            # Don't leave a long-running command (or its children) behind
+            if proc is not None and proc.returncode is None:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
             return SSHResult(
                 success=False,
                 stdout="",
                 stderr="",
                 exit_code=-1,
-                error=f"Command timeout ({self.timeout}s)"
+                error=f"Command timeout ({timeout}s)",
+                timed_out=True
             )
         except Exception as e:
             return SSHResult(
@@ -0,0 +1,53 @@
+"""
+SSH Pool - keeps one live SSH connection per (host, port, username, key)
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from config import get_settings
+from core.ssh_manager import SSHManager
+
+logger = logging.getLogger(__name__)
+
+_POOL: dict[tuple, SSHManager] = {}
+_LOCKS: dict[tuple, asyncio.Lock] = {}
+
+
+async def acquire(
+    host: str,
+    port: int = 22,
+    username: str = "root",
+    key_path: Optional[str] = None
+) -> SSHManager:
+    """Get a connected SSHManager for host, reconnecting if the connection dropped"""
+    # Keyed by the resolved key too, so a server re-added with another key gets a new connection
+    key_path = key_path or str(get_settings().expanded_ssh_key_path)
+    key = (host, port, username, key_path)
+    lock = _LOCKS.setdefault(key, asyncio.Lock())
+
+    async with lock:
+        ssh = _POOL.get(key)
+        if ssh is None:
+            ssh = SSHManager(host=host, port=port, username=username, key_path=key_path)
+            _POOL[key] = ssh
+
+        if not ssh.is_connected:
+            await ssh.connect()
+
+        return ssh
+
+
+async def acquire_server(server) -> SSHManager:
+    """Get a pooled SSHManager for a database Server"""
+    return await acquire(server.host, server.port, server.username, server.key_path)
+
+
+async def close_all() -> None:
+    """Close all pooled connections"""
+    for ssh in list(_POOL.values()):
+        try:
+            await ssh.close()
+        except Exception as e:
+            logger.error(f"Error closing SSH connection to {ssh.host}: {e}")
+    _POOL.clear()
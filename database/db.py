@@ -1,18 +1,43 @@
 """
 Database models and CRUD operations for server management
 """
+import asyncio
+import contextlib
 import aiosqlite
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, replace
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 
-from config import settings
+from config import get_settings
+from core.flags import COUNTRY_FLAGS, DEFAULT_FLAG
 
 
-@dataclass
+# Connection tuning: WAL with NORMAL sync avoids an fsync per commit,
+# the rest keeps temp data, pages and reads in memory
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+)
+
+
+# Columns added to servers after the first release: (name, type)
+_SERVER_EXTRA_COLUMNS = (
+    ("location", "TEXT"),
+    ("description", "TEXT"),
+    ("cpu_cores", "INTEGER"),
+    ("ram_gb", "REAL"),
+    ("disk_gb", "REAL"),
+    ("country", "TEXT"),
+)
+
+
+@dataclass(slots=True, frozen=True)
 class Server:
-    """Server configuration"""
+    """Server configuration (immutable, shared through the server cache)"""
     id: Optional[int]
     name: str
     host: str
@@ -30,6 +55,21 @@ class Server:
     cpu_cores: Optional[int] = None
     ram_gb: Optional[float] = None
     disk_gb: Optional[float] = None
+    country: Optional[str] = None  # key of COUNTRY_FLAGS, e.g. "Finland"
+
+    @property
+    def flag(self) -> str:
+        """Country flag for the server"""
+        return COUNTRY_FLAGS.get(self.country, DEFAULT_FLAG)
+
+    @classmethod
+    def from_row(cls, row) -> "Server":
+        """Build from a row selected with _SERVER_COLUMNS"""
+        return cls(*row)
+
+    def with_status(self, status: str, check_time) -> "Server":
+        """Copy of the server with a new last check"""
+        return replace(self, last_status=status, last_check=check_time)
 
 
 @dataclass
@@ -49,17 +89,159 @@ class ServerService:
     systemd_name: Optional[str] = None  # e.g., "xray.service"
     docker_name: Optional[str] = None  # for docker containers
 
+    @classmethod
+    def from_row(cls, row) -> "ServerService":
+        """Build from a row selected with _SERVICE_COLUMNS"""
+        return cls(*row)
+
+
+# Columns in dataclass field order, so rows can be passed to from_row() positionally
+_SERVER_COLUMNS = ", ".join(f.name for f in fields(Server))
+_SERVICE_COLUMNS = ", ".join(f"ss.{f.name}" for f in fields(ServerService))
+
+# Hot queries are kept as constants so each one is always the same SQL text
+# and hits sqlite3's per-connection prepared statement cache
+_SELECT_SERVER_SQL = f"SELECT {_SERVER_COLUMNS} FROM servers WHERE name = ?"
+_SELECT_SERVER_BY_ID_SQL = f"SELECT {_SERVER_COLUMNS} FROM servers WHERE id = ?"
+_SELECT_ALL_SERVERS_SQL = f"SELECT {_SERVER_COLUMNS} FROM servers ORDER BY name"
+_SELECT_ACTIVE_SERVERS_SQL = f"SELECT {_SERVER_COLUMNS} FROM servers WHERE is_active = 1 ORDER BY name"
+_SELECT_SERVICES_SQL = f"""
+    SELECT {_SERVICE_COLUMNS} FROM server_services ss
+    JOIN servers s ON ss.server_id = s.id
+    WHERE s.name = ?
+    ORDER BY ss.service_type, ss.name
+"""
+
+_UPDATE_LAST_CHECK_SQL = """
+    UPDATE servers
+    SET last_check = CURRENT_TIMESTAMP, last_status = ?
+    WHERE name = ?
+"""
+
+_INSERT_SERVICE_SQL = """
+    INSERT OR REPLACE INTO server_services
+    (server_id, name, service_type, description, port, status,
+     cpu_percent, ram_mb, disk_mb, config_path, systemd_name, docker_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_HISTORY_SQL = """
+    INSERT INTO check_history
+    (server_id, status, cpu_load, ram_percent, disk_percent, issues)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def _service_row(service: ServerService) -> tuple:
+    """Parameters for _INSERT_SERVICE_SQL"""
+    return (service.server_id, service.name, service.service_type,
+            service.description, service.port, service.status,
+            service.cpu_percent, service.ram_mb, service.disk_mb,
+            service.config_path, service.systemd_name, service.docker_name)
+
 
 class Database:
     """Database manager for server configurations"""
     
     def __init__(self, db_path: str = None):
-        self.db_path = db_path or settings.database_path
-        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        # Resolved on first use, so importing this module doesn't load settings
+        self._db_path = db_path
+        # In-memory copy of server rows, dropped on every write
+        self._servers: dict[str, Server] = {}
+        self._servers_version = 0
+        # Shared connection, opened on first use
+        self._db: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        # Task running inside transaction(), whose writes join that transaction
+        self._tx_task: Optional[asyncio.Task] = None
+    
+    @property
+    def db_path(self) -> str:
+        """Database file path (DATABASE_PATH unless given)"""
+        if self._db_path is None:
+            self._db_path = get_settings().database_path
+        return self._db_path
+    
+    @db_path.setter
+    def db_path(self, value: str) -> None:
+        self._db_path = value
+    
+    async def connect(self) -> aiosqlite.Connection:
+        """Open the shared connection if it isn't open yet"""
+        async with self._connect_lock:
+            if self._db is None:
+                Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+                conn = aiosqlite.connect(self.db_path)
+                # Don't keep the process alive if close() is never called
+                conn.daemon = True
+                db = await conn
+                db.row_factory = aiosqlite.Row
+                for pragma in _PRAGMAS:
+                    await db.execute(pragma)
+                self._db = db
+        return self._db
+    
+    async def close(self):
+        """Close the shared connection"""
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+    
+    @contextlib.asynccontextmanager
+    async def _read(self):
+        """Shared connection for queries"""
+        yield await self.connect()
+    
+    @contextlib.asynccontextmanager
+    async def _write(self):
+        """Shared connection for one write transaction, committed on success"""
+        db = await self.connect()
+        if self._tx_task is not None and self._tx_task is asyncio.current_task():
+            # Part of an outer transaction(), which commits or rolls back
+            yield db
+            return
+        async with self._write_lock:
+            try:
+                yield db
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+    
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Group several write methods into one transaction
+        
+        The writes must be awaited directly in the calling task, not spawned.
+        """
+        async with self._write() as db:
+            self._tx_task = asyncio.current_task()
+            try:
+                yield db
+            finally:
+                self._tx_task = None
+    
+    def _set_checked(self, name: str, status: str):
+        """Update last check of a cached server without re-reading it"""
+        self._servers_version += 1
+        server = self._servers.get(name)
+        if server:
+            # Same format as SQLite CURRENT_TIMESTAMP
+            now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            self._servers[name] = server.with_status(status, now)
+    
+    def _forget_server(self, name: Optional[str] = None):
+        """Drop cached server rows (all of them if name is None)"""
+        self._servers_version += 1
+        if name is None:
+            self._servers.clear()
+        else:
+            self._servers.pop(name, None)
     
     async def init(self):
         """Initialize database schema"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS servers (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -118,81 +300,83 @@ class Database:
                 )
             """)
 
+            # Indexes for per-server lookups
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_services_server ON server_services(server_id)"
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_history_server_ts ON check_history(server_id, timestamp DESC)"
+            )
+
             # Add metadata columns to servers if not exist
-            try:
-                await db.execute("ALTER TABLE servers ADD COLUMN location TEXT")
-            except:
-                pass
-            try:
-                await db.execute("ALTER TABLE servers ADD COLUMN description TEXT")
-            except:
-                pass
-            try:
-                await db.execute("ALTER TABLE servers ADD COLUMN cpu_cores INTEGER")
-            except:
-                pass
-            try:
-                await db.execute("ALTER TABLE servers ADD COLUMN ram_gb REAL")
-            except:
-                pass
-            try:
-                await db.execute("ALTER TABLE servers ADD COLUMN disk_gb REAL")
-            except:
-                pass
+            cursor = await db.execute("PRAGMA table_info(servers)")
+            columns = {row[1] for row in await cursor.fetchall()}
+            for column, column_type in _SERVER_EXTRA_COLUMNS:
+                if column not in columns:
+                    await db.execute(f"ALTER TABLE servers ADD COLUMN {column} {column_type}")
+
+            if "country" not in columns:
+                # Servers used to be flagged by name, keep those flags
+                await db.execute(
+                    f"UPDATE servers SET country = name WHERE name IN ({', '.join('?' * len(COUNTRY_FLAGS))})",
+                    tuple(COUNTRY_FLAGS)
+                )
 
-            await db.commit()
+            self._forget_server()
     
     async def add_server(self, server: Server) -> int:
         """Add a new server"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("""
-                INSERT INTO servers (name, host, port, username, key_path, password)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO servers (name, host, port, username, key_path, password, country)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (server.name, server.host, server.port, server.username, 
-                  server.key_path, server.password))
-            await db.commit()
+                  server.key_path, server.password, server.country))
+            self._forget_server(server.name)
             return cursor.lastrowid
     
     async def get_server(self, name: str) -> Optional[Server]:
         """Get server by name"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT * FROM servers WHERE name = ?", (name,)
-            )
+        server = self._servers.get(name)
+        if server:
+            return server
+
+        version = self._servers_version
+        async with self._read() as db:
+            cursor = await db.execute(_SELECT_SERVER_SQL, (name,))
             row = await cursor.fetchone()
             if row:
-                return Server(**dict(row))
+                server = Server.from_row(row)
+                # Don't cache a row that was changed while we were reading it
+                if version == self._servers_version:
+                    self._servers[name] = server
+                return server
             return None
     
     async def get_server_by_id(self, server_id: int) -> Optional[Server]:
         """Get server by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT * FROM servers WHERE id = ?", (server_id,)
-            )
+        async with self._read() as db:
+            cursor = await db.execute(_SELECT_SERVER_BY_ID_SQL, (server_id,))
             row = await cursor.fetchone()
             if row:
-                return Server(**dict(row))
+                return Server.from_row(row)
             return None
     
     async def get_all_servers(self, active_only: bool = True) -> list[Server]:
         """Get all servers"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            query = "SELECT * FROM servers"
-            if active_only:
-                query += " WHERE is_active = 1"
-            query += " ORDER BY name"
-            
+        version = self._servers_version
+        async with self._read() as db:
+            query = _SELECT_ACTIVE_SERVERS_SQL if active_only else _SELECT_ALL_SERVERS_SQL
             cursor = await db.execute(query)
             rows = await cursor.fetchall()
-            return [Server(**dict(row)) for row in rows]
+            servers = [Server.from_row(row) for row in rows]
+            if version == self._servers_version:
+                self._servers.update((server.name, server) for server in servers)
+            return servers
     
     async def update_server(self, server: Server) -> bool:
         """Update server configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE servers 
                 SET host = ?, port = ?, username = ?, key_path = ?, 
@@ -200,25 +384,33 @@ class Database:
                 WHERE name = ?
             """, (server.host, server.port, server.username, server.key_path,
                   server.password, server.is_active, server.name))
-            await db.commit()
+            self._forget_server(server.name)
             return True
     
     async def update_last_check(self, name: str, status: str) -> bool:
         """Update last check timestamp and status"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                UPDATE servers 
-                SET last_check = CURRENT_TIMESTAMP, last_status = ?
-                WHERE name = ?
-            """, (status, name))
-            await db.commit()
+        async with self._write() as db:
+            await db.execute(_UPDATE_LAST_CHECK_SQL, (status, name))
+            self._set_checked(name, status)
+            return True
+    
+    async def update_last_check_bulk(self, items: list[tuple[str, str]]) -> bool:
+        """Update last check for many servers in one transaction, items are (name, status)"""
+        if not items:
+            return True
+        async with self._write() as db:
+            await db.executemany(
+                _UPDATE_LAST_CHECK_SQL, [(status, name) for name, status in items]
+            )
+            for name, status in items:
+                self._set_checked(name, status)
             return True
     
     async def delete_server(self, name: str) -> bool:
         """Delete server by name"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM servers WHERE name = ?", (name,))
-            await db.commit()
+            self._forget_server(name)
             return True
     
     async def add_check_history(
@@ -231,17 +423,24 @@ class Database:
         issues: str
     ):
         """Add check to history"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO check_history 
-                (server_id, status, cpu_load, ram_percent, disk_percent, issues)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (server_id, status, cpu_load, ram_percent, disk_percent, issues))
-            await db.commit()
+        async with self._write() as db:
+            await db.execute(_INSERT_HISTORY_SQL, (
+                server_id, status, cpu_load, ram_percent, disk_percent, issues
+            ))
+    
+    async def add_check_history_many(self, rows: list[tuple]) -> None:
+        """Add many checks to history in one transaction
+        
+        rows are (server_id, status, cpu_load, ram_percent, disk_percent, issues)
+        """
+        if not rows:
+            return
+        async with self._write() as db:
+            await db.executemany(_INSERT_HISTORY_SQL, rows)
     
     async def get_setting(self, key: str) -> Optional[str]:
         """Get a setting value"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute(
                 "SELECT value FROM settings WHERE key = ?", (key,)
             )
@@ -250,11 +449,10 @@ class Database:
     
     async def set_setting(self, key: str, value: str):
         """Set a setting value"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)
             """, (key, value))
-            await db.commit()
 
     # ============== Server Metadata ==============
 
@@ -265,60 +463,53 @@ class Database:
         description: str = None,
         cpu_cores: int = None,
         ram_gb: float = None,
-        disk_gb: float = None
+        disk_gb: float = None,
+        country: str = None
     ) -> bool:
         """Update server metadata"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE servers
                 SET location = COALESCE(?, location),
                     description = COALESCE(?, description),
                     cpu_cores = COALESCE(?, cpu_cores),
                     ram_gb = COALESCE(?, ram_gb),
-                    disk_gb = COALESCE(?, disk_gb)
+                    disk_gb = COALESCE(?, disk_gb),
+                    country = COALESCE(?, country)
                 WHERE name = ?
-            """, (location, description, cpu_cores, ram_gb, disk_gb, name))
-            await db.commit()
+            """, (location, description, cpu_cores, ram_gb, disk_gb, country, name))
+            self._forget_server(name)
             return True
 
     # ============== Server Services ==============
 
     async def add_service(self, service: ServerService) -> int:
         """Add a service to a server"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                INSERT OR REPLACE INTO server_services
-                (server_id, name, service_type, description, port, status,
-                 cpu_percent, ram_mb, disk_mb, config_path, systemd_name, docker_name)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (service.server_id, service.name, service.service_type,
-                  service.description, service.port, service.status,
-                  service.cpu_percent, service.ram_mb, service.disk_mb,
-                  service.config_path, service.systemd_name, service.docker_name))
-            await db.commit()
+        async with self._write() as db:
+            cursor = await db.execute(_INSERT_SERVICE_SQL, _service_row(service))
             return cursor.lastrowid
 
+    async def add_services(self, services: list[ServerService]) -> None:
+        """Add many services in one transaction"""
+        if not services:
+            return
+        async with self._write() as db:
+            await db.executemany(_INSERT_SERVICE_SQL, [_service_row(s) for s in services])
+
     async def get_server_services(self, server_name: str) -> list[ServerService]:
         """Get all services for a server"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("""
-                SELECT ss.* FROM server_services ss
-                JOIN servers s ON ss.server_id = s.id
-                WHERE s.name = ?
-                ORDER BY ss.service_type, ss.name
-            """, (server_name,))
+        async with self._read() as db:
+            cursor = await db.execute(_SELECT_SERVICES_SQL, (server_name,))
             rows = await cursor.fetchall()
-            return [ServerService(**dict(row)) for row in rows]
+            return [ServerService.from_row(row) for row in rows]
 
     async def delete_server_services(self, server_name: str) -> bool:
         """Delete all services for a server"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 DELETE FROM server_services
                 WHERE server_id = (SELECT id FROM servers WHERE name = ?)
             """, (server_name,))
-            await db.commit()
             return True
 
 
@@ -2,9 +2,12 @@
 Server Health Bot - Main entry point
 """
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
-from pathlib import Path
+from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
@@ -13,25 +16,37 @@ from aiogram.enums import ParseMode
 from config import settings
 from database.db import db
 from bot.handlers import router
-from scheduler.jobs import setup_scheduler, start_scheduler, stop_scheduler
+from core import background, ssh_pool
+from scheduler.jobs import load_check_interval, setup_scheduler, start_scheduler, stop_scheduler
+
+
+# Writes log records to file/stdout on a background thread
+_log_listener: Optional[logging.handlers.QueueListener] = None
 
 
 # Setup logging
 def setup_logging():
-    """Configure logging"""
+    """Configure logging (file and stdout writes happen off the event loop)"""
+    global _log_listener
     log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     
-    # Create logs directory
-    Path(settings.log_file).parent.mkdir(parents=True, exist_ok=True)
+    # Records are formatted by the queue handler and written by the listener thread
+    log_queue = queue.Queue(-1)
+    _log_listener = logging.handlers.QueueListener(
+        log_queue,
+        logging.FileHandler(settings.log_file),
+        logging.StreamHandler(sys.stdout),
+        respect_handler_level=True
+    )
+    _log_listener.start()
+    # Flush queued records on any exit, including sys.exit() on bad config
+    atexit.register(_log_listener.stop)
     
     # Configure root logger
     logging.basicConfig(
         level=getattr(logging, settings.log_level),
         format=log_format,
-        handlers=[
-            logging.FileHandler(settings.log_file),
-            logging.StreamHandler(sys.stdout)
-        ]
+        handlers=[logging.handlers.QueueHandler(log_queue)]
     )
     
     # Reduce noise from libraries
@@ -50,7 +65,7 @@ async def on_startup(bot: Bot):
     logger.info("Database initialized")
     
     # Setup and start scheduler
-    setup_scheduler(bot)
+    setup_scheduler(bot, await load_check_interval())
     start_scheduler()
     logger.info("Scheduler started")
     
@@ -73,6 +88,15 @@ async def on_shutdown(bot: Bot):
     # Stop scheduler
     stop_scheduler()
     
+    # Let running cleanups finish before their SSH connections are closed
+    await background.drain(settings.ssh_timeout)
+    
+    # Close pooled SSH connections
+    await ssh_pool.close_all()
+    
+    # Close database connection
+    await db.close()
+    
     # Notify admin
     try:
         await bot.send_message(
@@ -1,22 +1,136 @@
 """
 Scheduler for periodic health checks
 """
+import asyncio
+import html
 import logging
+import time
+from collections import defaultdict
 from datetime import datetime
+from typing import Optional
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from aiogram import Bot
 
-from config import settings
+from config import get_settings
 from database.db import db
-from core.health_checker import check_local_server, check_remote_server
+from core import background, ssh_pool
+from core.health_checker import HealthReport, empty_report
+from core.optimize import AUTO_CLEAN_COMMAND, parse_auto_clean
 from core.report_formatter import format_full_report, format_all_servers_summary
-from core.ssh_manager import SSHManager
+from bot.report_cache import SCHEDULER_TTL, get_report, last_report
 
 logger = logging.getLogger(__name__)
 
-# Global scheduler instance
-scheduler = AsyncIOScheduler()
+# Disk usage in % that triggers an automatic cleanup
+AUTO_CLEAN_PERCENT = 80
+
+# Cleanup is folded into the next check once the last report was above this
+AUTO_CLEAN_PREDICT_PERCENT = 75
+
+# Admin message templates; {name} is the HTML-escaped server name
+_ALERT_SUMMARY_HEADER = "📊 <b>Плановая проверка</b>\n\n"
+_ALERT_CRITICAL_HEADER = "🚨 <b>КРИТИЧЕСКОЕ СОСТОЯНИЕ</b>\n\n"
+_ALERT_DISK_OPTIMIZE = (
+    "🧹 <b>Авто-оптимизация: {name}</b>\n\n"
+    "Диск был заполнен на {disk_percent}%\n"
+    "{result}"
+)
+_AUTO_CLEAN_DONE = "✅ Очищено, диск: {disk_percent}%"
+
+# Alert sent when a server becomes critical
+_CRITICAL_CHANGE_ALERT = (
+    "🚨 <b>ВНИМАНИЕ: {name}</b>\n\n"
+    "Статус изменился на КРИТИЧЕСКИЙ!\n\n"
+    "{issues}"
+)
+
+# Seconds the alert check may fire early or late, so instances don't probe in lockstep
+ALERT_CHECK_JITTER = 30
+
+# Quick checks of a server that stays critical are backed off: next check time
+# (time.monotonic(), counted from the start of the tick) and current delay in seconds,
+# per server name
+_next_check_at: dict[str, float] = {}
+_check_backoff: dict[str, float] = {}
+
+# One check per host at a time, so overlapping jobs don't stack SSH sessions on a slow host
+_host_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# settings table key holding the interval chosen in the bot
+CHECK_INTERVAL_SETTING = "check_interval_hours"
+
+# Global scheduler instance; a slow run is never overlapped by the next one,
+# and missed runs are merged into one instead of firing back to back
+scheduler = AsyncIOScheduler(job_defaults={
+    "coalesce": True,
+    "max_instances": 1,
+    "misfire_grace_time": 60,
+})
+
+
+def _backoff_quick_check(name: str, started: float) -> None:
+    """Push the next quick check of a critical server back, doubling the delay up to ALERT_SILENCE_MINUTES"""
+    settings = get_settings()
+    cap = settings.alert_silence_minutes * 60
+    if cap <= 0:
+        return
+    delay = min(_check_backoff.get(name, settings.alert_check_interval_minutes * 60 / 2) * 2, cap)
+    _check_backoff[name] = delay
+    _next_check_at[name] = started + delay
+
+
+def _reset_quick_check(name: str) -> None:
+    """Return a server to the normal quick check cadence"""
+    _next_check_at.pop(name, None)
+    _check_backoff.pop(name, None)
+
+
+def _history_row(server, report) -> tuple:
+    """check_history row for a report: (server_id, status, cpu, ram, disk, issues)"""
+    disk = max((d.value for d in report.disks), default=None)
+    return (
+        server.id,
+        report.overall_status,
+        report.cpu_load.value,
+        report.ram.value,
+        disk,
+        "\n".join(report.issues)
+    )
+
+
+async def _send_admin_messages(bot: Bot, texts: list[str], what: str) -> None:
+    """Send texts to the admin concurrently over the bot's shared session, logging failures"""
+    results = await asyncio.gather(
+        *(bot.send_message(chat_id=get_settings().admin_id, text=text, parse_mode="HTML") for text in texts),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send {what}: {result}")
+
+
+async def _check_server(
+    server,
+    semaphore: asyncio.Semaphore,
+    auto_clean: bool = False
+) -> Optional[HealthReport]:
+    """Run a health check for server, logging and returning None on failure"""
+    # Connecting may take the whole SSH_TIMEOUT, the batched probes as much again,
+    # and the per-command fallback after a timed-out batch once more
+    timeout = get_settings().ssh_timeout * 3
+    try:
+        async with _host_locks[server.host], semaphore:
+            async with asyncio.timeout(timeout):
+                # Reuse a report from a recent tick or bot request instead of a new SSH session
+                return await get_report(server, ttl=SCHEDULER_TTL, auto_clean=auto_clean)
+    except asyncio.TimeoutError:
+        logger.warning(f"Health check of {server.name} timed out after {timeout}s")
+        return empty_report(server.name, datetime.utcnow(), f"Check timeout ({timeout}s)")
+    except Exception as e:
+        logger.error(f"Error checking {server.name}: {e}")
+        return None
 
 
 async def scheduled_health_check(bot: Bot):
@@ -31,79 +145,54 @@ async def scheduled_health_check(bot: Bot):
     
     reports = []
     critical_reports = []
+    statuses = []
+    history = []
     
-    for server in servers:
-        try:
-            if server.host == "localhost":
-                report = await check_local_server(server.name)
-            else:
-                report = await check_remote_server(
-                    host=server.host,
-                    name=server.name,
-                    port=server.port,
-                    username=server.username,
-                    key_path=server.key_path
-                )
-            
-            reports.append(report)
-            await db.update_last_check(server.name, report.overall_status)
-            
-            # Track critical issues
-            if report.overall_status == "critical":
-                critical_reports.append(report)
-                
-        except Exception as e:
-            logger.error(f"Error checking {server.name}: {e}")
+    # Check all servers concurrently
+    semaphore = asyncio.Semaphore(get_settings().max_parallel_checks)
+    results = await asyncio.gather(*(_check_server(server, semaphore) for server in servers))
     
-    # Send summary to admin
-    if reports:
-        text = "📊 <b>Плановая проверка</b>\n\n" + format_all_servers_summary(reports)
+    for server, report in zip(servers, results):
+        if report is None:
+            continue
         
-        try:
-            await bot.send_message(
-                chat_id=settings.admin_id,
-                text=text,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send scheduled report: {e}")
+        # Recovered: quick checks go back to the normal cadence
+        if report.overall_status != "critical":
+            _reset_quick_check(server.name)
+        reports.append(report)
+        statuses.append((server.name, report.overall_status))
+        history.append(_history_row(server, report))
+        
+        # Track critical issues
+        if report.overall_status == "critical":
+            critical_reports.append(report)
     
-    # Send critical alerts
-    for report in critical_reports:
-        alert_text = (
-            f"🚨 <b>КРИТИЧЕСКОЕ СОСТОЯНИЕ</b>\n\n"
-            f"{format_full_report(report)}"
-        )
-        try:
-            await bot.send_message(
-                chat_id=settings.admin_id,
-                text=alert_text,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send critical alert: {e}")
+    # Send summary to admin in the background, overlapping the DB writes below
+    if reports:
+        text = _ALERT_SUMMARY_HEADER + format_all_servers_summary(reports, servers)
+        background.spawn(_send_admin_messages(bot, [text], "scheduled report"), name="scheduled_report")
+    
+    await db.update_last_check_bulk(statuses)
+    await db.add_check_history_many(history)
+    
+    # Send critical alerts (awaited, they are what the job is for)
+    await _send_admin_messages(bot, [
+        _ALERT_CRITICAL_HEADER + format_full_report(report)
+        for report in critical_reports
+    ], "critical alert")
 
 
 async def auto_optimize_server(server, bot: Bot) -> str:
     """Auto-optimize server when disk > 80%"""
     try:
-        ssh = SSHManager(
-            host=server.host,
-            port=server.port,
-            username=server.username,
-            key_path=server.key_path
-        )
-
-        # Clean journal and cache
-        await ssh.execute("journalctl --vacuum-size=200M 2>&1")
-        await ssh.execute("apt-get clean 2>/dev/null; rm -rf /tmp/* /var/tmp/* 2>/dev/null")
+        ssh = await ssh_pool.acquire_server(server)
 
-        # Check new disk usage
-        result = await ssh.execute("df / --output=pcent | tail -1 | tr -d ' %'")
-        new_percent = int(result.stdout.strip()) if result.success else 0
+        # Clean journal and cache, then check new disk usage, in one round trip
+        result = await ssh.execute(AUTO_CLEAN_COMMAND)
+        new_percent = parse_auto_clean(result.stdout) if result.success else 0
 
         logger.info(f"Auto-optimized {server.name}, disk now at {new_percent}%")
-        return f"✅ Очищено, диск: {new_percent}%"
+        return _AUTO_CLEAN_DONE.format(disk_percent=new_percent)
 
     except Exception as e:
         logger.error(f"Auto-optimize error for {server.name}: {e}")
@@ -114,101 +203,150 @@ async def quick_alert_check(bot: Bot):
     """Quick check for critical issues (more frequent)"""
     servers = await db.get_all_servers()
 
-    for server in servers:
-        try:
-            if server.host == "localhost":
-                report = await check_local_server(server.name)
+    semaphore = asyncio.Semaphore(get_settings().max_parallel_checks)
+    results = await asyncio.gather(*(_quick_check_server(server, bot, semaphore) for server in servers))
+
+    # Auto-optimize notices are informational: don't hold the job for them
+    notices = [text for texts, _ in results for text in texts]
+    if notices:
+        background.spawn(_send_admin_messages(bot, notices, "auto-optimize notice"), name="auto_optimize_notice")
+
+    # Send all alerts of this tick at once
+    await _send_admin_messages(bot, [text for _, texts in results for text in texts], "alert")
+
+
+async def _quick_check_server(
+    server,
+    bot: Bot,
+    semaphore: asyncio.Semaphore
+) -> tuple[list[str], list[str]]:
+    """Quick check of one server: auto-optimize full disks, return (notices, alerts) for the admin"""
+    notices = []
+    alerts = []
+
+    # Already alerted as critical: wait out the backoff (a recovery seen by the full check ends it).
+    # A tick may come up to ALERT_CHECK_JITTER early and still count as on time
+    started = time.monotonic()
+    deadline = _next_check_at.get(server.name, 0) - ALERT_CHECK_JITTER
+    if server.last_status == "critical" and started < deadline:
+        return notices, alerts
+
+    # Disk was nearly full last time: clean up in the same SSH call as the check
+    last = last_report(server.name)
+    auto_clean = False
+    if last is not None:
+        last_disk = last.auto_clean_disk_percent
+        if last_disk is None:
+            last_disk = last.disk_percent
+        auto_clean = last_disk > AUTO_CLEAN_PREDICT_PERCENT
+
+    report = await _check_server(server, semaphore, auto_clean)
+    if report is None:
+        return notices, alerts
+
+    name = html.escape(server.name)
+    try:
+        if report.auto_clean_disk_percent is not None:
+            logger.info(f"Auto-cleaned {server.name}, disk now at {report.auto_clean_disk_percent}%")
+
+        # Auto-optimize if disk > 80%
+        if report.disk_percent > AUTO_CLEAN_PERCENT:
+            if report.auto_clean_disk_percent is not None:
+                optimize_result = _AUTO_CLEAN_DONE.format(disk_percent=report.auto_clean_disk_percent)
             else:
-                report = await check_remote_server(
-                    host=server.host,
-                    name=server.name,
-                    port=server.port,
-                    username=server.username,
-                    key_path=server.key_path
-                )
-
-            # Auto-optimize if disk > 80%
-            if report.disk_percent > 80:
                 logger.info(f"Disk on {server.name} at {report.disk_percent}%, auto-optimizing...")
                 optimize_result = await auto_optimize_server(server, bot)
 
-                await bot.send_message(
-                    chat_id=settings.admin_id,
-                    text=(
-                        f"🧹 <b>Авто-оптимизация: {server.name}</b>\n\n"
-                        f"Диск был заполнен на {report.disk_percent}%\n"
-                        f"{optimize_result}"
-                    ),
-                    parse_mode="HTML"
-                )
-
-            # Only alert on status change to critical
-            if report.overall_status == "critical" and server.last_status != "critical":
-                alert_text = (
-                    f"🚨 <b>ВНИМАНИЕ: {server.name}</b>\n\n"
-                    f"Статус изменился на КРИТИЧЕСКИЙ!\n\n"
-                )
-                for issue in report.issues:
-                    alert_text += f"• {issue}\n"
-
-                await bot.send_message(
-                    chat_id=settings.admin_id,
-                    text=alert_text,
-                    parse_mode="HTML"
-                )
-
-            await db.update_last_check(server.name, report.overall_status)
-
-        except Exception as e:
-            logger.error(f"Quick check error for {server.name}: {e}")
-
-
-def setup_scheduler(bot: Bot):
+            notices.append(_ALERT_DISK_OPTIMIZE.format_map({
+                "name": name,
+                "disk_percent": report.disk_percent,
+                "result": optimize_result,
+            }))
+
+        # Only alert on status change to critical
+        if report.overall_status == "critical" and server.last_status != "critical":
+            issues = "\n".join(f"• {issue}" for issue in report.issues)
+            alerts.append(_CRITICAL_CHANGE_ALERT.format_map({"name": name, "issues": issues}))
+
+        if report.overall_status == "critical":
+            _backoff_quick_check(server.name, started)
+        else:
+            _reset_quick_check(server.name)
+
+        await db.update_last_check(server.name, report.overall_status)
+
+    except Exception as e:
+        logger.error(f"Quick check error for {server.name}: {e}")
+
+    return notices, alerts
+
+
+async def load_check_interval() -> int:
+    """Health check interval in hours: the value saved from the bot, else CHECK_INTERVAL_HOURS"""
+    value = await db.get_setting(CHECK_INTERVAL_SETTING)
+    try:
+        return int(value) if value is not None else get_settings().check_interval_hours
+    except ValueError:
+        logger.error(f"Invalid saved check interval: {value!r}")
+        return get_settings().check_interval_hours
+
+
+def _add_health_check_job(hours: int, bot: Bot):
+    """Add the periodic health check job"""
+    scheduler.add_job(
+        scheduled_health_check,
+        trigger=IntervalTrigger(hours=hours),
+        args=[bot],
+        id="health_check",
+        replace_existing=True,
+        name="Periodic health check"
+    )
+
+
+def setup_scheduler(bot: Bot, check_interval_hours: Optional[int] = None):
     """Setup scheduled jobs"""
+    if check_interval_hours is None:
+        check_interval_hours = get_settings().check_interval_hours
     
     # Main health check (default: every 6 hours)
-    if settings.check_interval_hours > 0:
-        scheduler.add_job(
-            scheduled_health_check,
-            trigger=IntervalTrigger(hours=settings.check_interval_hours),
-            args=[bot],
-            id="health_check",
-            replace_existing=True,
-            name="Periodic health check"
-        )
-        logger.info(f"Scheduled health check every {settings.check_interval_hours} hours")
+    if check_interval_hours > 0:
+        _add_health_check_job(check_interval_hours, bot)
+        logger.info(f"Scheduled health check every {check_interval_hours} hours")
     
     # Quick alert check (default: every 15 minutes)
-    if settings.alert_check_interval_minutes > 0:
+    alert_minutes = get_settings().alert_check_interval_minutes
+    if alert_minutes > 0:
         scheduler.add_job(
             quick_alert_check,
-            trigger=IntervalTrigger(minutes=settings.alert_check_interval_minutes),
+            trigger=IntervalTrigger(
+                minutes=alert_minutes,
+                jitter=ALERT_CHECK_JITTER
+            ),
             args=[bot],
             id="alert_check",
             replace_existing=True,
             name="Quick alert check"
         )
-        logger.info(f"Scheduled alert check every {settings.alert_check_interval_minutes} minutes")
+        logger.info(f"Scheduled alert check every {alert_minutes} minutes")
 
 
-def update_check_interval(hours: int, bot: Bot):
-    """Update the health check interval"""
-    # Remove existing job
-    try:
-        scheduler.remove_job("health_check")
-    except:
-        pass
-    
-    if hours > 0:
-        scheduler.add_job(
-            scheduled_health_check,
-            trigger=IntervalTrigger(hours=hours),
-            args=[bot],
-            id="health_check",
-            replace_existing=True,
-            name="Periodic health check"
-        )
+async def update_check_interval(hours: int, bot: Bot):
+    """Update the health check interval and save it for the next start (0 = off)"""
+    if hours <= 0:
+        try:
+            scheduler.remove_job("health_check")
+        except JobLookupError:
+            pass
+        logger.info("Disabled periodic health check")
+    else:
+        try:
+            scheduler.reschedule_job("health_check", trigger=IntervalTrigger(hours=hours))
+        except JobLookupError:
+            # Check was off
+            _add_health_check_job(hours, bot)
         logger.info(f"Updated health check interval to {hours} hours")
+    
+    await db.set_setting(CHECK_INTERVAL_SETTING, str(hours))
 
 
 def start_scheduler():
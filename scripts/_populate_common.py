@@ -0,0 +1,81 @@
+"""
+Shared pipeline for the populate scripts: server record, metadata and services
+"""
+import asyncio
+import sys
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+# Add parent directory to path and change to it for .env loading
+project_dir = Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(project_dir))
+os.chdir(project_dir)
+
+from database.db import db, Server, ServerService
+
+
+@dataclass
+class ServerConfig:
+    """Server to populate: connection, metadata and services (ServerService fields)"""
+    name: str
+    host: str
+    port: int = 22
+    username: str = "root"
+    key_path: Optional[str] = None
+    metadata: dict = field(default_factory=dict)
+    services: list[dict] = field(default_factory=list)
+
+
+async def populate(cfg: ServerConfig) -> None:
+    """Create the server if needed, then replace its metadata and services"""
+    server = await db.get_server(cfg.name)
+
+    if not server:
+        print(f"[{cfg.name}] Server not found. Creating...")
+        server_id = await db.add_server(Server(
+            id=None,
+            name=cfg.name,
+            host=cfg.host,
+            port=cfg.port,
+            username=cfg.username,
+            key_path=cfg.key_path
+        ))
+        server = await db.get_server(cfg.name)
+        print(f"[{cfg.name}] Created server with ID: {server_id}")
+
+    print(f"[{cfg.name}] Found server: {server.name} ({server.host})")
+
+    await db.update_server_metadata(name=cfg.name, **cfg.metadata)
+    print(f"[{cfg.name}] Updated server metadata")
+
+    # Replace services in one transaction
+    services = [ServerService(id=None, server_id=server.id, **svc) for svc in cfg.services]
+    async with db.transaction():
+        await db.delete_server_services(cfg.name)
+        await db.add_services(services)
+    print(f"[{cfg.name}] Added {len(services)} services: {', '.join(svc.name for svc in services)}")
+
+    # Verify
+    services = await db.get_server_services(cfg.name)
+    lines = [f"[{cfg.name}] Total services: {len(services)}"]
+    lines += [f"  - {s.name} ({s.service_type})" for s in services]
+    print("\n".join(lines))
+
+
+async def populate_all(configs: list[ServerConfig]) -> None:
+    """Populate several servers concurrently"""
+    await db.init()
+    try:
+        await asyncio.gather(*(populate(cfg) for cfg in configs))
+    finally:
+        await db.close()
+    print(f"\n{', '.join(cfg.name for cfg in configs)} server data populated successfully!")
+
+
+def main(*names: str) -> None:
+    """Populate the named servers from scripts/servers.py (all of them if none given)"""
+    from servers import SERVERS
+    configs = [SERVERS[name] for name in names] if names else list(SERVERS.values())
+    asyncio.run(populate_all(configs))
@@ -0,0 +1,11 @@
+"""
+Script to populate server data for every server in scripts/servers.py
+Usage: python scripts/populate.py [NAME ...]
+"""
+import sys
+
+from _populate_common import main
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,178 @@
+"""
+Server registry for the populate scripts - adding a server is a data-only change
+"""
+from _populate_common import ServerConfig
+
+
+_CONFIGS = [
+    ServerConfig(
+        name="Finland",
+        host="65.109.142.30",
+        port=22,
+        username="root",
+        key_path="~/.ssh/id_ed25519",
+        metadata=dict(
+            location="Finland, Hetzner",
+            description="VPN & Media Bot Server",
+            cpu_cores=2,
+            ram_gb=1.9,
+            disk_gb=38,
+            country="Finland",
+        ),
+        services=[
+            dict(
+                name="Xray",
+                service_type="vpn",
+                description="VPN-прокси (VLESS protocol)",
+                port="443",
+                status="active",
+                cpu_percent=1.3,
+                ram_mb=26,
+                disk_mb=0.016,
+                config_path="/usr/local/etc/xray/config.json",
+                systemd_name="xray.service",
+            ),
+            dict(
+                name="AdGuard Home",
+                service_type="dns",
+                description="DNS с блокировкой рекламы",
+                port="53,80,853,8443",
+                status="active",
+                cpu_percent=1.0,
+                ram_mb=122,
+                disk_mb=399,
+                config_path="/opt/AdGuardHome/AdGuardHome.yaml",
+                systemd_name="AdGuardHome.service",
+            ),
+            dict(
+                name="Telegram Cover Bot",
+                service_type="bot",
+                description="Скачивание медиа (YouTube, VK, Yandex)",
+                port=None,
+                status="active",
+                cpu_percent=0,
+                ram_mb=15,
+                disk_mb=235,
+                config_path="/opt/telegram-cover-bot/.env",
+                systemd_name="telegram-cover-bot.service",
+            ),
+            dict(
+                name="Telegram Bot API",
+                service_type="api",
+                description="Локальный API (файлы до 2GB)",
+                port="8081",
+                status="active",
+                cpu_percent=1.0,
+                ram_mb=8,
+                disk_mb=50,
+                docker_name="telegram-bot-api",
+            ),
+            dict(
+                name="BGUtil Provider",
+                service_type="media",
+                description="YouTube PoT для обхода защиты",
+                port="4416",
+                status="active",
+                cpu_percent=0,
+                ram_mb=5,
+                disk_mb=20,
+                docker_name="bgutil-provider",
+            ),
+        ],
+    ),
+    ServerConfig(
+        name="Russia",
+        host="176.108.251.49",
+        port=22,
+        username="artemfcsm",
+        key_path="~/.ssh/id_ed25519",
+        metadata=dict(
+            location="Russia, Moscow (Cloud.ru)",
+            description="Monitoring Bot Server",
+            cpu_cores=2,
+            ram_gb=2,
+            disk_gb=10,
+            country="Russia",
+        ),
+        services=[
+            dict(
+                name="Server Health Bot",
+                service_type="monitoring",
+                description="Мониторинг здоровья серверов",
+                port=None,
+                status="active",
+                cpu_percent=0,
+                ram_mb=150,
+                disk_mb=50,
+                config_path="/opt/server-health-bot/.env",
+                systemd_name="server-health-bot.service",
+            ),
+        ],
+    ),
+    ServerConfig(
+        name="USA",
+        host="178.156.167.178",
+        port=22,
+        username="root",
+        key_path="~/.ssh/id_ed25519",
+        metadata=dict(
+            location="USA, Virginia (Ashburn)",
+            description="Monitoring & AI Agent Server",
+            cpu_cores=2,
+            ram_gb=1.9,
+            disk_gb=38,
+            country="USA",
+        ),
+        services=[
+            dict(
+                name="Server Health Bot",
+                service_type="monitoring",
+                description="Мониторинг здоровья серверов",
+                port=None,
+                status="active",
+                cpu_percent=0,
+                ram_mb=174,
+                disk_mb=69,
+                config_path="/opt/server-health-bot/.env",
+                systemd_name="server-health-bot.service",
+            ),
+            dict(
+                name="Telegram AI Agent",
+                service_type="bot",
+                description="AI-агент для Telegram",
+                port=None,
+                status="active",
+                cpu_percent=0.5,
+                ram_mb=216,
+                disk_mb=189,
+                config_path="/opt/telegram_ai_agent/.env",
+                systemd_name="telegram-ai-agent.service",
+            ),
+            dict(
+                name="Telegram Bot Manager",
+                service_type="bot",
+                description="Менеджер Telegram ботов",
+                port=None,
+                status="active",
+                cpu_percent=0,
+                ram_mb=119,
+                disk_mb=0,
+                systemd_name="telegram-bot-manager.service",
+            ),
+            dict(
+                name="Xray",
+                service_type="vpn",
+                description="VPN-прокси (VLESS protocol)",
+                port="443",
+                status="active",
+                cpu_percent=0,
+                ram_mb=35,
+                disk_mb=0.016,
+                config_path="/usr/local/etc/xray/config.json",
+                systemd_name="xray.service",
+            ),
+        ],
+    ),
+]
+
+SERVERS = {cfg.name: cfg for cfg in _CONFIGS}